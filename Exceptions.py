@@ -2,5 +2,23 @@ class InvalidObject(Exception):
 	def __init__(self, message):
 		self.message = message
 
+	def __str__(self):
+		return self.message
+
+
+class BatchError(Exception):
+	def __init__(self, message, errors=None):
+		self.message = message
+		self.errors = errors or {}
+
+	def __str__(self):
+		return self.message
+
+
+class ReportError(Exception):
+	def __init__(self, message, report=None):
+		self.message = message
+		self.report = report
+
 	def __str__(self):
 		return self.message
\ No newline at end of file
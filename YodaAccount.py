@@ -1,9 +1,6 @@
 from facebookads.api import FacebookAdsApi
 from facebookads import objects
-from facebookads.api import FacebookRequest
-from facebookads.typechecker import TypeChecker
-from facebookads.adobjects.objectparser import ObjectParser
-from facebookads.adobjects.abstractcrudobject import AbstractCrudObject
+from facebookads.exceptions import FacebookRequestError
 from facebookads.objects import (
     AdUser,
     Campaign,
@@ -18,8 +15,31 @@ from facebookads.objects import (
 from facebookads.adobjects.adcreativelinkdata import AdCreativeLinkData
 from facebookads.adobjects.adcreativeobjectstoryspec import AdCreativeObjectStorySpec
 from facebookads.adobjects.targetinggeolocation import TargetingGeoLocation
-from .Exceptions import InvalidObject
+from facebookads.adobjects.adreportrun import AdReportRun
+from .Exceptions import InvalidObject, ReportError
 from . import utils
+from .YodaCursor import PrefetchCursor
+from .YodaNameIndex import getNameIndex
+from .YodaFilter import ObjectFilter
+from .YodaEdges import Edge
+from .YodaTracing import traced, bindContext
+from concurrent.futures import ThreadPoolExecutor
+import time
+
+
+INSIGHTS_FIELDS = [
+    'campaign_name',
+    'adset_name',
+    'adset_id',
+    'impressions',
+    'website_clicks',
+    'app_store_clicks',
+    'deeplink_clicks',
+    'spend',
+    'reach',
+    'actions',
+    'action_values'
+]
 
 class YodaAccount(AdAccount):
 
@@ -28,7 +48,8 @@ class YodaAccount(AdAccount):
         super().__init__(fbid, parent_id, api)
 
 
-    def createCampaign(self, name, spend_cap=10000):
+    @traced()
+    def createCampaign(self, name, spend_cap=10000, pending=False):
 
         params = {
             Campaign.Field.name : name,
@@ -37,23 +58,68 @@ class YodaAccount(AdAccount):
             Campaign.Field.spend_cap : spend_cap
         }
 
+        if pending:
+            return self.create_campaign(params=params, pending=True)
         campaign = self.create_campaign(params = params)
+        self.campaignNameIndex().add(name, campaign.get_id_assured())
         return campaign
 
 
-    def getCampaignByName(self, name):
-        allCampaigns = self.get_campaigns({Campaign.Field.name})
-        campaign = None
-        variasOcurrencias = False
-        for camp in allCampaigns:
-            if camp[Campaign.Field.name] == name:
-                if campaign:
-                    raise LookupError("Hay más de una campaña con el mismo nombre")
-                campaign = camp
+    @traced()
+    def getCampaignByName(self, name, page_size=100, max_pages=2, use_index=True, max_age=600):
+        if not use_index:
+            # Filtra en el servidor: solo se descargan las campañas con ese nombre
+            campaigns = list(self.findCampaigns(name=name, page_size=page_size))
+            if len(campaigns) > 1:
+                raise LookupError("Hay más de una campaña con el mismo nombre")
+            return campaigns[0] if campaigns else None
+        campaignId = self.campaignNameIndex(page_size, max_pages, max_age).get(name)
+        if not campaignId:
+            return None
+        campaign = Campaign(fbid=campaignId)
+        campaign.set_data({Campaign.Field.name: name})
         return campaign
 
 
+    def findCampaigns(self, fields=None, page_size=100, **filters):
+        return self._findObjects(self.get_campaigns, fields, page_size, ObjectFilter(**filters))
 
+
+    def findAdSets(self, fields=None, page_size=100, **filters):
+        return self._findObjects(self.get_ad_sets, fields, page_size, ObjectFilter(**filters))
+
+
+    def findAds(self, fields=None, page_size=100, **filters):
+        return self._findObjects(self.get_ads, fields, page_size, ObjectFilter(**filters))
+
+
+    def _findObjects(self, edge, fields, page_size, objectFilter):
+        # filters: name, name_contains, effective_status, updated_since, updated_until, campaign_ids, adset_ids
+        fields = list(fields or []) + [f for f in objectFilter.fields() if f not in (fields or [])]
+        try:
+            cursor = edge(fields=fields, params={'filtering': objectFilter.filtering(), 'limit': page_size})
+        except FacebookRequestError as e:
+            # Solo si la API rechaza el filtro (parámetro no válido) se recorre el edge completo y se filtra en local;
+            # los límites de uso, permisos o errores del servidor se propagan
+            if e.api_error_code() != 100:
+                raise
+            cursor = edge(fields=fields, params={'limit': page_size})
+        for obj in PrefetchCursor(cursor):
+            if objectFilter.matches(obj):
+                yield obj
+
+
+    def campaignNameIndex(self, page_size=100, max_pages=2, max_age=600):
+        # Índice nombre -> id compartido por todas las instancias de esta cuenta
+        loader = lambda: PrefetchCursor(
+            self.get_campaigns({Campaign.Field.name}, params={'limit': page_size}),
+            max_pages
+        )
+        return getNameIndex(self.get_id_assured(), 'campaigns', loader, "Hay más de una campaña con el mismo nombre", max_age)
+
+
+
+    @traced()
     def createAdSet(
         self,
         campaign, #objeto Campaign
@@ -68,7 +134,8 @@ class YodaAccount(AdAccount):
         interests=[], #lista de objetos con id y nombre de cada interes
         age_min=None,
         age_max=None,
-        genders=None
+        genders=None,
+        pending=False
     ):
         targeting = {}
         targeting[TargetingSpecsField.geo_locations] = {
@@ -95,16 +162,46 @@ class YodaAccount(AdAccount):
         params[AdSet.Field.status] = status
         params[AdSet.Field.targeting] = targeting
 
-        response = self.create_ad_set(params=params)
+        response = self.create_ad_set(params=params, pending=pending)
         return response
 
 
-    def createAdImage(self, filepath):
+    @traced()
+    def createAdImage(self, filepath, index=None, digest=None):
+        # Con un ImageIndex, las imágenes ya subidas a esta cuenta no se vuelven a subir
+        if index is not None:
+            digest = digest or index.digest(filepath)
+            imageHash = index.getHash(self.get_id_assured(), digest)
+            if imageHash:
+                image = AdImage()
+                image[AdImage.Field.hash] = imageHash
+                return image
         image = AdImage()
-        return image.api_create(parent_id=self.get_id_assured(),params={AdImage.Field.filename: filepath})
+        image = image.api_create(parent_id=self.get_id_assured(),params={AdImage.Field.filename: filepath})
+        if index is not None:
+            index.setHash(self.get_id_assured(), digest, image.get_hash())
+        return image
 
 
-    def createAdCreative(self, name, imageHash, message, headline, description, caption, url, pageId):
+    @traced()
+    def createAdImages(self, filepaths, max_workers=4, index=None):
+        # Se sube una sola vez cada contenido distinto, aunque aparezca con varios nombres
+        fileDigest = index.digest if index is not None else utils.fileDigest
+        digests = dict((filepath, fileDigest(filepath)) for filepath in set(filepaths))
+        uniqueFiles = {}
+        for filepath, digest in digests.items():
+            uniqueFiles.setdefault(digest, filepath)
+
+        # El digest ya calculado se pasa para no volver a leer cada fichero
+        uploadImage = lambda item: self.createAdImage(item[1], index=index, digest=item[0])
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            images = dict(zip(uniqueFiles.keys(), executor.map(bindContext(uploadImage), uniqueFiles.items())))
+
+        return dict((filepath, images[digest].get_hash()) for filepath, digest in digests.items())
+
+
+    @traced()
+    def createAdCreative(self, name, imageHash, message, headline, description, caption, url, pageId, pending=False):
 
         linkData = AdCreativeLinkData()
         linkData[AdCreativeLinkData.Field.message] = message
@@ -127,10 +224,11 @@ class YodaAccount(AdAccount):
             AdCreative.Field.name: name,
         }
         adCrea = AdCreative()
-        return adCrea.api_create(parent_id=self.get_id_assured(), params=params)
+        return adCrea.api_create(parent_id=self.get_id_assured(), params=params, pending=pending)
 
 
-    def createAd(self, name, adset, adcrea, status):
+    @traced()
+    def createAd(self, name, adset, adcrea, status, pending=False):
         ad = Ad()
         params = {
             Ad.Field.name: name,
@@ -139,17 +237,35 @@ class YodaAccount(AdAccount):
             Ad.Field.redownload: True,
             Ad.Field.status: status
         }
-        ad.api_create(parent_id=self.get_id_assured(), params=params)
+        request = ad.api_create(parent_id=self.get_id_assured(), params=params, pending=pending)
+        if pending:
+            return request
         return ad
 
 
-    def setSpendCap(self, spendCap):
-        resp = self.api_update(params={AdAccount.Field.spend_cap: spendCap})
+    @traced()
+    def setSpendCap(self, spendCap, pending=False):
+        resp = self.api_update(params={AdAccount.Field.spend_cap: spendCap}, pending=pending)
         return resp
 
 
-    def getAccountInfo(self):
-        fields = [
+    # Conjuntos de campos con nombre para no pedir más de lo necesario
+    FIELD_PROFILES = {
+        'status': [
+            AdAccount.Field.id,
+            AdAccount.Field.name,
+            AdAccount.Field.account_status,
+            AdAccount.Field.disable_reason
+        ],
+        'spend': [
+            AdAccount.Field.id,
+            AdAccount.Field.name,
+            AdAccount.Field.amount_spent,
+            AdAccount.Field.balance,
+            AdAccount.Field.spend_cap,
+            AdAccount.Field.currency
+        ],
+        'full': [
             AdAccount.Field.id,
             AdAccount.Field.account_id,
             AdAccount.Field.account_status,
@@ -175,89 +291,129 @@ class YodaAccount(AdAccount):
             AdAccount.Field.timezone_offset_hours_utc,
             AdAccount.Field.user_role
         ]
-        return self.api_get(fields=fields)
+    }
+
+
+    @traced()
+    def getAccountInfo(self, profile='full'):
+        return self.api_get(fields=self.FIELD_PROFILES[profile])
+
 
+    @classmethod
+    def getAccountsInfo(cls, account_ids, profile='status', chunk_size=50, api=None):
+        # Lecturas multi-id (?ids=) de hasta 50 cuentas por petición
+        fields = cls.FIELD_PROFILES[profile]
+        ids = [fbid if str(fbid).startswith('act_') else 'act_%s' % fbid for fbid in account_ids]
+        for start in range(0, len(ids), chunk_size):
+            for account in cls.get_by_ids(ids[start:start + chunk_size], fields=fields, api=api):
+                yield account.export_all_data()
 
-    def getAdSetsRecommendations(self):
-        adsets = self.get_ad_sets()
-        recommendations = []
+
+    def getAdSetsRecommendations(self, page_size=100):
+        # Las recomendaciones vienen en el propio listado; el cursor pide cada página al consumirla
+        adsets = self.get_ad_sets(fields=[AdSet.Field.id, AdSet.Field.recommendations], params={'limit': page_size})
         for adset in adsets:
-            recommendations.append(adset.api_get(fields={"recommendations"}))
-        return recommendations
+            yield adset
 
 
-    def assign_user_to_ad_account(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    assign_user_to_ad_account = Edge(
+        method='POST',
+        endpoint='/userpermissions',
+        param_types={
             'business': 'string',
             'role': 'role_enum',
             'user': 'string',
-        }
-        enums = {
+        },
+        enums={
             'role_enum': [
                 'ADMIN',
                 'GENERAL_USER',
                 'REPORTS_ONLY'
             ],
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='POST',
-            endpoint='/userpermissions',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='EDGE',
-            response_parser=ObjectParser(target_class=AbstractCrudObject),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+        },
+    )
 
 
-    def assignAdAccount(self, business_id):
+    @traced()
+    def assignAdAccount(self, business_id, pending=False):
         params = {
             'business': business_id,
             'role': 'ADMIN',
             'user': utils.getCurrentAccountId()
         }
-        resp = self.assign_user_to_ad_account(params=params)
+        resp = self.assign_user_to_ad_account(params=params, pending=pending)
         return resp
 
 
-    def assignUser(self, business_id, act_id):
+    @traced()
+    def assignUser(self, business_id, act_id, pending=False):
         params = {
             'business': business_id,
             'role': 'ADMIN',
             'user': act_id
         }
-        resp = self.assign_user_to_ad_account(params=params)
+        resp = self.assign_user_to_ad_account(params=params, pending=pending)
         return resp
 
 
-    def getCampaignInsights(self, campaign):
-        params = {
-            'date_preset': Campaign.DatePreset.last_7_days,
-            'fields': [Insights.Field.impressions, Insights.Field.ad_id, Insights.Field.cpc, Insights.Field.objective ]
-        }
-        fields = [
-            'campaign_name',
-            'adset_name',
-            'adset_id',
-            'impressions',
-            'website_clicks',
-            'app_store_clicks',
-            'deeplink_clicks',
-            'spend',
-            'reach',
-            'actions',
-            'action_values'
-        ]
-        return campaign.get_insights(params=params, fields=fields)
\ No newline at end of file
+    @traced()
+    def getCampaignInsights(
+        self,
+        campaign,
+        date_preset=None, # por defecto, últimos 7 días
+        time_range=None, # {'since': 'YYYY-MM-DD', 'until': 'YYYY-MM-DD'}, sustituye a date_preset
+        breakdowns=None,
+        level=None, # 'ad', 'adset' o 'campaign'
+        is_async=False,
+        page_size=None
+    ):
+        if is_async:
+            report = self.submitInsightsReport(campaign, date_preset, time_range, breakdowns, level)
+            return self.getInsightsReportResults(report, page_size=page_size)
+        params = self._insightsParams(date_preset, time_range, breakdowns, level)
+        if page_size:
+            params['limit'] = page_size
+        return campaign.get_insights(params=params, fields=INSIGHTS_FIELDS)
+
+
+    @traced()
+    def submitInsightsReport(self, campaign, date_preset=None, time_range=None, breakdowns=None, level=None):
+        params = self._insightsParams(date_preset, time_range, breakdowns, level)
+        return campaign.get_insights_async(fields=INSIGHTS_FIELDS, params=params)
+
+
+    @traced()
+    def isInsightsReportReady(self, report):
+        report.api_get(fields=[AdReportRun.Field.async_status, AdReportRun.Field.async_percent_completion])
+        status = report[AdReportRun.Field.async_status]
+        if status in ('Job Failed', 'Job Skipped'):
+            raise ReportError("El informe %s ha terminado con estado '%s'" % (report.get_id(), status), report)
+        return status == 'Job Completed'
+
+
+    @traced()
+    def getInsightsReportResults(self, report, page_size=None, poll_interval=2, max_poll_interval=60, timeout=3600):
+        # Consulta el estado del informe con espera exponencial hasta que termina
+        delay = poll_interval
+        deadline = time.time() + timeout
+        while not self.isInsightsReportReady(report):
+            if time.time() + delay > deadline:
+                raise ReportError("El informe %s no ha terminado en %d segundos" % (report.get_id(), timeout), report)
+            time.sleep(delay)
+            delay = min(delay * 2, max_poll_interval)
+
+        params = {'limit': page_size} if page_size else None
+        return report.get_insights(params=params)
+
+
+    def _insightsParams(self, date_preset, time_range, breakdowns, level):
+        params = {}
+        if time_range:
+            params['time_range'] = time_range
+        else:
+            params['date_preset'] = date_preset or Campaign.DatePreset.last_7d
+        if breakdowns:
+            params['breakdowns'] = breakdowns
+        if level:
+            params['level'] = level
+        return params
\ No newline at end of file
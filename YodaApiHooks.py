@@ -0,0 +1,58 @@
+class ApiCallHook(object):
+
+    # Sustituye a api.call en una instancia concreta de FacebookAdsApi; varios hooks se encadenan
+    # de mayor a menor order, independientemente del orden en que se activen
+    order = 0
+
+    def __init__(self, api):
+        self.api = api
+        self.call = api.call
+
+
+    def __call__(self, method, path, params=None, headers=None, files=None, url_override=None, api_version=None):
+        return self.call(method, path, params, headers, files, url_override, api_version)
+
+
+    @classmethod
+    def find(cls, api):
+        hook = api.__dict__.get('call')
+        while isinstance(hook, ApiCallHook):
+            if isinstance(hook, cls):
+                return hook
+            hook = hook.call
+        return None
+
+
+    @classmethod
+    def install(cls, api):
+        hook = cls.find(api)
+        if hook is not None:
+            return hook
+        hook = cls(api)
+        previous, current = None, api.__dict__.get('call')
+        while isinstance(current, ApiCallHook) and current.order > cls.order:
+            previous, current = current, current.call
+        if current is not None:
+            hook.call = current
+        if previous is None:
+            api.call = hook
+        else:
+            previous.call = hook
+        return hook
+
+
+    @classmethod
+    def uninstall(cls, api):
+        hook = cls.find(api)
+        if hook is None:
+            return
+        if api.__dict__.get('call') is hook:
+            if isinstance(hook.call, ApiCallHook):
+                api.call = hook.call
+            else:
+                del api.call
+            return
+        previous = api.__dict__['call']
+        while previous.call is not hook:
+            previous = previous.call
+        previous.call = hook.call
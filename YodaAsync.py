@@ -0,0 +1,515 @@
+from facebookads.api import FacebookAdsApi, FacebookRequest, FacebookResponse, _top_level_param_json_encode
+from facebookads.session import FacebookSession
+from facebookads.adobjects.objectparser import ObjectParser
+from facebookads.objects import Campaign, AdSet, AdAccount, Ad, AdImage
+from .YodaAccount import YodaAccount, INSIGHTS_FIELDS
+from .YodaBusiness import YodaBusiness
+from .YodaProject import Project
+from .YodaIdentity import getIdentity
+from .YodaJournal import Checkpoints
+from .YodaSearchCache import SearchCache
+from . import utils
+from . import YodaTracing
+from . import YodaThrottle
+from . import YodaRetry
+from facebookads.exceptions import FacebookRequestError
+import aiohttp
+import asyncio
+import copy
+import time
+import os
+
+
+class AsyncClient(object):
+
+    def __init__(self, api=None, limit=100, per_account_limit=10, timeout=60, connect_timeout=5, keepalive_timeout=30):
+        self._api = api or FacebookAdsApi.get_default_api()
+        self._limit = limit
+        self._perAccountLimit = per_account_limit
+        self._timeout = timeout
+        self._connectTimeout = connect_timeout
+        self._keepaliveTimeout = keepalive_timeout
+        self._session = None
+        self._semaphores = {}
+
+
+    async def __aenter__(self):
+        return self
+
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+        return False
+
+
+    async def close(self):
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+
+    def wrap(self, obj):
+        if isinstance(obj, YodaBusiness):
+            return AsyncYodaBusiness(self, obj)
+        if isinstance(obj, YodaAccount):
+            return AsyncYodaAccount(self, obj)
+        return AsyncProxy(self, obj)
+
+
+    def _getSession(self):
+        # Una sola sesión (y un solo pool de conexiones) para todas las peticiones del cliente
+        if self._session is None:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self._limit, keepalive_timeout=self._keepaliveTimeout),
+                timeout=aiohttp.ClientTimeout(total=self._timeout, connect=self._connectTimeout),
+            )
+        return self._session
+
+
+    def _semaphore(self, path):
+        # Límite de peticiones simultáneas por cuenta publicitaria
+        node = '' if isinstance(path, str) or not path else str(path[0])
+        if not node.startswith('act_'):
+            return None
+        if node not in self._semaphores:
+            self._semaphores[node] = asyncio.Semaphore(self._perAccountLimit)
+        return self._semaphores[node]
+
+
+    async def call(self, method, path, params=None, files=None):
+        policy = YodaRetry.policy
+        if policy is None:
+            return await self._limited(method, path, params, files)
+        return await policy.runAsync(
+            method,
+            path,
+            params,
+            lambda: self._limited(method, path, params, files),
+            (aiohttp.ClientConnectionError, asyncio.TimeoutError),
+        )
+
+
+    async def _limited(self, method, path, params, files):
+        semaphore = self._semaphore(path)
+        if semaphore is None:
+            return await self._throttled(method, path, params, files)
+        async with semaphore:
+            return await self._throttled(method, path, params, files)
+
+
+    async def _throttled(self, method, path, params, files):
+        # Comparte los buckets con el cliente síncrono; la espera no bloquea el event loop
+        scheduler = YodaThrottle.scheduler
+        if scheduler is None:
+            return await self._traced(method, path, params, files)
+        wait = scheduler.reserve(method, path, params)
+        if wait:
+            await asyncio.sleep(wait)
+        try:
+            response = await self._traced(method, path, params, files)
+        except FacebookRequestError as e:
+            scheduler.throttled(method, path, params, e)
+            raise
+        scheduler.update(method, path, params, response.headers())
+        return response
+
+
+    async def _traced(self, method, path, params, files):
+        tracer = YodaTracing.tracer
+        if tracer is None:
+            return await self._send(method, path, params, files)
+        start = time.perf_counter()
+        try:
+            response = await self._send(method, path, params, files)
+        except FacebookRequestError as e:
+            tracer.record(YodaTracing.callEvent(method, path, params, files, e.http_status(), e.body(), time.perf_counter() - start, e))
+            raise
+        tracer.record(YodaTracing.callEvent(method, path, params, files, response.status(), response.body(), time.perf_counter() - start))
+        return response
+
+
+    async def _send(self, method, path, params, files):
+        if isinstance(path, str):
+            # Las URLs de paginación ('next') ya incluyen el token
+            url = path
+            query = {}
+        else:
+            url = '/'.join((FacebookSession.GRAPH, self._api._api_version) + tuple(str(p) for p in path))
+            query = dict(self._api._session.requests.params)
+        params = _top_level_param_json_encode(params) if params else {}
+
+        data = None
+        if method in ('GET', 'DELETE'):
+            query.update(params)
+        else:
+            data = aiohttp.FormData()
+            for key, value in params.items():
+                data.add_field(key, str(value))
+            for key, (filename, content) in (files or {}).items():
+                data.add_field(key, content, filename=filename)
+
+        async with self._getSession().request(
+            method,
+            url,
+            params=query,
+            data=data,
+            headers=FacebookAdsApi.HTTP_DEFAULT_HEADERS,
+        ) as resp:
+            body = await resp.text()
+            response = FacebookResponse(
+                body=body,
+                http_status=resp.status,
+                headers=dict(resp.headers),
+                call={'method': method, 'path': url, 'params': params},
+            )
+        if response.is_failure():
+            raise response.error()
+        return response
+
+
+    async def execute(self, request):
+        if request._api_type == 'EDGE' and request._method == 'GET':
+            return [obj async for obj in self.iterate(request)]
+        params = copy.deepcopy(request._params)
+        if request._fields:
+            params['fields'] = ','.join(request._fields)
+        files = {}
+        loop = asyncio.get_running_loop()
+        for key, filepath in request._file_params.items():
+            files[key] = (os.path.basename(filepath), await loop.run_in_executor(None, _readFile, filepath))
+        response = await self.call(request._method, request._path, params, files)
+        if request._response_parser:
+            return request._response_parser.parse_single(response.json())
+        return response
+
+
+    async def iterate(self, request):
+        # Recorre un edge página a página sin bloquear el event loop
+        params = copy.deepcopy(request._params)
+        if request._fields:
+            params['fields'] = ','.join(request._fields)
+        parser = ObjectParser(api=request._api, target_class=request._target_class)
+        path = request._path
+        while path:
+            data = (await self.call('GET', path, params)).json()
+            for obj in parser.parse_multiple(data):
+                yield obj
+            path = data.get('paging', {}).get('next')
+            params = None
+
+
+    async def userId(self):
+        # Comparte la identidad memorizada con el cliente síncrono
+        identity = getIdentity(self._api)
+        if identity.cachedUserId() is None:
+            response = await self.call('GET', ('me',), {'fields': 'id'})
+            identity.setUserId(response.json()['id'])
+        return identity.cachedUserId()
+
+
+    async def search(self, params):
+        # La caché es SQLite: se consulta fuera del event loop
+        loop = asyncio.get_running_loop()
+        cache = utils.searchCache
+        key = SearchCache.key(params)
+        data = await loop.run_in_executor(None, cache.get, key) if cache is not None else None
+        if data is None:
+            response = (await self.call('GET', ('search',), params)).json()
+            data = response.get('data') or []
+            if isinstance(data, dict):
+                data = [item for item in data.values() if item]
+            if cache is not None:
+                await loop.run_in_executor(None, cache.set, key, data)
+        return utils.searchObjects(data)
+
+
+def _readFile(filepath):
+    with open(filepath, 'rb') as f:
+        return f.read()
+
+
+class AsyncProxy(object):
+
+    # Métodos que necesitan el id del usuario actual al construir la petición
+    NEEDS_USER = {'assignAdAccount', 'requestPageAccess', 'assignPage', 'create_page', 'createPage'}
+
+    def __init__(self, client, obj):
+        self._client = client
+        self._obj = obj
+
+
+    def __getattr__(self, name):
+        # Cualquier método que admita pending=True tiene su versión awaitable
+        method = getattr(self._obj, name)
+        if not callable(method):
+            return method
+
+        async def call(*args, **kwargs):
+            if name in self.NEEDS_USER:
+                await self._client.userId()
+            request = method(*args, pending=True, **kwargs)
+            if not isinstance(request, FacebookRequest):
+                raise TypeError("'%s' no admite pending=True" % name)
+            return await self._client.execute(request)
+        return call
+
+
+    def unwrap(self):
+        return self._obj
+
+
+    async def _getByName(self, index, request, name):
+        # El mismo NameIndex que el cliente síncrono; si hay que cargarlo se recorre el edge sin bloquear el event loop
+        if index.expired():
+            index.fill([obj async for obj in self._client.iterate(request)])
+        return index.get(name, reload=False)
+
+
+class AsyncYodaAccount(AsyncProxy):
+
+    async def createCampaign(self, name, spend_cap=10000):
+        campaign = await self._client.execute(self._obj.createCampaign(name, spend_cap, pending=True))
+        self._obj.campaignNameIndex().add(name, campaign.get_id_assured())
+        return campaign
+
+
+    async def getCampaignByName(self, name, page_size=100, max_age=600):
+        request = self._obj.get_campaigns({Campaign.Field.name}, params={'limit': page_size}, pending=True)
+        campaignId = await self._getByName(self._obj.campaignNameIndex(page_size, max_age=max_age), request, name)
+        if not campaignId:
+            return None
+        campaign = Campaign(fbid=campaignId)
+        campaign.set_data({Campaign.Field.name: name})
+        return campaign
+
+
+    async def createAdImage(self, filepath, index=None, digest=None):
+        # Con un ImageIndex, como en YodaAccount.createAdImage; el índice (SQLite) se usa fuera del event loop
+        loop = asyncio.get_running_loop()
+        accountId = self._obj.get_id_assured()
+        if index is not None:
+            digest = digest or await loop.run_in_executor(None, index.digest, filepath)
+            imageHash = await loop.run_in_executor(None, index.getHash, accountId, digest)
+            if imageHash:
+                image = AdImage()
+                image[AdImage.Field.hash] = imageHash
+                return image
+        request = self._obj.create_ad_image(pending=True)
+        request.add_file(filepath)
+        image = await self._client.execute(request)
+        if index is not None:
+            await loop.run_in_executor(None, index.setHash, accountId, digest, image.get_hash())
+        return image
+
+
+    async def createAdImages(self, filepaths, index=None):
+        # Una subida por contenido distinto, todas a la vez (limitadas por per_account_limit)
+        loop = asyncio.get_running_loop()
+        fileDigest = index.digest if index is not None else utils.fileDigest
+        paths = list(set(filepaths))
+        digests = await asyncio.gather(*[loop.run_in_executor(None, fileDigest, path) for path in paths])
+        uniqueFiles = {}
+        for filepath, digest in zip(paths, digests):
+            uniqueFiles.setdefault(digest, filepath)
+        images = await asyncio.gather(*[
+            self.createAdImage(path, index=index, digest=digest) for digest, path in uniqueFiles.items()
+        ])
+        hashes = dict(zip(uniqueFiles.keys(), [image.get_hash() for image in images]))
+        return dict((filepath, hashes[digest]) for filepath, digest in zip(paths, digests))
+
+
+    async def getCampaignInsights(self, campaign, date_preset=None, time_range=None, breakdowns=None, level=None, page_size=None):
+        params = self._obj._insightsParams(date_preset, time_range, breakdowns, level)
+        if page_size:
+            params['limit'] = page_size
+        request = campaign.get_insights(params=params, fields=INSIGHTS_FIELDS, pending=True)
+        return await self._client.execute(request)
+
+
+class AsyncYodaBusiness(AsyncProxy):
+
+    async def createAdAccount(self, name, funding_id, currency="EUR", timezone_id=1, partner="NONE", end_advertiser="NONE", media_agency="NONE"):
+        request = self._obj.createAdAccount(name, funding_id, currency, timezone_id, partner, end_advertiser, media_agency, pending=True)
+        resp = await self._client.execute(request)
+        self._obj.accountNameIndex().add(name, resp.get_id_assured())
+        return self._client.wrap(YodaAccount(resp.get_id_assured()))
+
+
+    async def getAccountByName(self, name, page_size=100, max_age=600):
+        request = self._obj.get_owned_ad_accounts({AdAccount.Field.name}, params={'limit': page_size}, pending=True)
+        accountId = await self._getByName(self._obj.accountNameIndex(page_size, max_age=max_age), request, name)
+        if not accountId:
+            return None
+        return self._client.wrap(YodaAccount(accountId))
+
+
+    async def createProject(self, name):
+        project = await self._client.execute(self._obj.createProject(name, pending=True))
+        self._obj.projectNameIndex().add(name, project['id'])
+        return project
+
+
+    async def getProjectByName(self, name, page_size=100, max_age=600):
+        request = self._obj.get_projects(params={'limit': page_size}, pending=True)
+        projectId = await self._getByName(self._obj.projectNameIndex(page_size, max_age=max_age), request, name)
+        if not projectId:
+            return None
+        project = Project(fbid=projectId)
+        project.set_data({'name': name})
+        return project
+
+
+    async def createAccountStructure(self, acc, overwrite=False, image_index=None, journal=None):
+        ads = acc['ads']
+        name = acc['name']
+        page_id = acc['page_id']
+        steps = journal.open(self._obj.get_id_assured(), acc) if journal is not None else Checkpoints()
+
+        if 'account' in steps:
+            account = self._client.wrap(YodaAccount(steps.get('account')))
+        else:
+            # El índice se recarga para comprobar el nombre antes de crear la cuenta
+            account = await self.getAccountByName(name, max_age=0)
+            if account and overwrite==False:
+                raise NameError("Ya existe una cuenta con ese nombre")
+            if not account:
+                account = await self.createAdAccount(name, acc['funding_id'], acc['currency'])
+            steps.record('account', account.unwrap().get_id_assured())
+        if 'assigned' not in steps:
+            await account.assignAdAccount(self._obj.get_id_assured())
+            steps.record('assigned', True)
+
+        async def createCampaign():
+            if 'campaign' in steps:
+                return Campaign(fbid=steps.get('campaign'))
+            campaign = await account.createCampaign(name)
+            steps.record('campaign', campaign.get_id_assured())
+            return campaign
+
+        async def searchInterests():
+            # Solo hacen falta para crear el conjunto de anuncios
+            return None if 'adset' in steps else await getInterests(self._client, acc['keywords'])
+
+        async def createAdImages():
+            missing = [ad['image_filename'] for ad in ads if 'image:' + ad['image_filename'] not in steps]
+            if missing:
+                for filepath, imageHash in (await account.createAdImages(missing, index=image_index)).items():
+                    steps.record('image:' + filepath, imageHash)
+            return dict((ad['image_filename'], steps.get('image:' + ad['image_filename'])) for ad in ads)
+
+        # La campaña, los intereses y las imágenes no dependen entre sí
+        campaign, interests, imageHashes = await _gatherAll(
+            createCampaign(),
+            searchInterests(),
+            createAdImages(),
+        )
+        if 'adset' in steps:
+            adset = AdSet(fbid=steps.get('adset'))
+        else:
+            adset = await account.createAdSet(
+                campaign,
+                name,
+                acc['bid_amount'],
+                acc['start_date'],
+                acc['end_date'],
+                acc['country_code'],
+                daily_budget=acc['spend_cap']*100,
+                interests=interests
+            )
+            steps.record('adset', adset.get_id_assured())
+
+        async def createAd(i, ad):
+            if 'ad%d' % i in steps:
+                return Ad(fbid=steps.get('ad%d' % i))
+            if 'creative%d' % i not in steps:
+                crea = await account.createAdCreative(name,
+                    imageHashes[ad['image_filename']],
+                    ad['message'],
+                    ad['headline'],
+                    ad['description'],
+                    ad['caption'],
+                    ad['url'],
+                    page_id)
+                steps.record('creative%d' % i, crea['id'])
+            remoteAd = await account.createAd(name, adset, {'creative_id': steps.get('creative%d' % i)}, Ad.Status.paused)
+            steps.record('ad%d' % i, remoteAd.get_id_assured())
+            return remoteAd
+
+        return await _gatherAll(*[createAd(i, ad) for i, ad in enumerate(ads)])
+
+
+async def _gatherAll(*aws):
+    # Como gather, pero si algo falla espera a que terminen las demás antes de lanzar el error,
+    # para que todo lo que se llegue a crear quede registrado
+    results = await asyncio.gather(*aws, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+# Equivalentes awaitable de los helpers de utils
+
+async def getCurrentAccountId(client):
+    return await client.userId()
+
+
+async def activateCampaign(client, campaign):
+    return await client.execute(utils.activateCampaign(campaign, pending=True))
+
+
+async def pauseCampaign(client, campaign):
+    return await client.execute(utils.pauseCampaign(campaign, pending=True))
+
+
+async def getInterestsByKeyword(client, keyword):
+    return await client.search({
+        'q': keyword,
+        'type': 'adinterest'
+    })
+
+
+async def getInterestSuggestionByInterestList(client, keywords):
+    return await client.search({
+        'type': 'adinterestsuggestion',
+        'interest_list': keywords,
+    })
+
+
+async def getAllCategories(client):
+    return await client.search({
+        'type': 'adTargetingCategory',
+        'class': 'interests',
+    })
+
+
+async def validateInterests(client, keywords):
+    return await client.search({
+        'type': 'adinterestvalid',
+        'interest_list': keywords
+    })
+
+
+async def getInterests(client, keywords, max_concurrency=8):
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def limited(coro):
+        async with semaphore:
+            return await coro
+
+    validated, *byKeyword = await asyncio.gather(
+        limited(validateInterests(client, keywords)),
+        *[limited(getInterestsByKeyword(client, kw)) for kw in keywords]
+    )
+
+    interests = {}
+    for respInterest in validated:
+        if respInterest['valid'] == True:
+            interests.setdefault(respInterest['id'], {'id': respInterest['id'], 'name': respInterest['name']})
+    for targetings in byKeyword:
+        for targeting in targetings:
+            interests.setdefault(targeting['id'], {'id': targeting['id'], 'name': targeting['name']})
+    suggested = await getInterestSuggestionByInterestList(client, [intr['name'] for intr in interests.values()])
+    for intr in suggested:
+        interests.setdefault(intr['id'], {'id': intr['id'], 'name': intr['name']})
+    return list(interests.values())
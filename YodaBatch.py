@@ -0,0 +1,308 @@
+from facebookads.api import FacebookAdsApi
+from .Exceptions import BatchError
+from .YodaTracing import traced, bindContext
+from . import YodaRetry
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import copy
+import time
+import re
+
+
+RESULT_REF = re.compile(r'\{result=([^:}]+):\$\.([^}]*)\}')
+
+
+class YodaBatch(object):
+
+    # Limite de peticiones por llamada batch de la Graph API
+    MAX_SIZE = 50
+
+    def __init__(self, api=None, max_workers=4):
+        self._api = api or FacebookAdsApi.get_default_api()
+        self._maxWorkers = max_workers
+        self._calls = []
+        self._deps = {}
+        self._responses = {}
+        self._results = {}
+        self._errors = {}
+
+
+    def __len__(self):
+        return len(self._calls)
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # Solo se ejecuta lo planificado si el bloque terminó sin errores
+        if exc_type is None:
+            self.execute()
+        return False
+
+
+    @staticmethod
+    def resultRef(name, path='id'):
+        return '{result=%s:$.%s}' % (name, path)
+
+
+    def add(self, request, name=None, depends_on=None):
+        if name is None:
+            name = 'op%d' % len(self._calls)
+        if name in self._deps:
+            raise ValueError("Ya existe una petición con el nombre '%s'" % name)
+        if depends_on is None:
+            depends_on = []
+        elif isinstance(depends_on, str):
+            depends_on = [depends_on]
+        refs = self._references([request._node_id, request._params])
+        deps = list(depends_on) + [ref for ref in refs if ref not in depends_on]
+        for dep in deps:
+            if dep not in self._deps:
+                raise ValueError("La petición '%s' depende de '%s', que no se ha añadido antes" % (name, dep))
+        self._deps[name] = deps
+        self._calls.append((name, request))
+        return name
+
+
+    def getResult(self, name):
+        return self._results[name]
+
+
+    def hasResult(self, name):
+        return name in self._results
+
+
+    def getError(self, name):
+        return self._errors.get(name)
+
+
+    @traced()
+    def execute(self):
+        chunks = self._plan()
+        chunkOf = {}
+        for index, chunk in enumerate(chunks):
+            for name, _ in chunk:
+                chunkOf[name] = index
+        # Un chunk se lanza cuando han terminado las peticiones externas de las que depende
+        waitingFor = [
+            set(dep for name, _ in chunk for dep in self._deps[name] if chunkOf[dep] != index)
+            for index, chunk in enumerate(chunks)
+        ]
+
+        finished, skipped = set(), set()
+        pending = set(range(len(chunks)))
+        with ThreadPoolExecutor(max_workers=self._maxWorkers) as executor:
+            running = {}
+            while pending or running:
+                ready = [i for i in sorted(pending) if waitingFor[i] <= finished]
+                for index in ready:
+                    pending.discard(index)
+                    calls = self._runnable(chunks[index], skipped)
+                    if calls:
+                        running[executor.submit(bindContext(self._executeChunk), calls)] = (index, calls)
+                    else:
+                        finished.update(name for name, _ in chunks[index])
+                if not running:
+                    if ready:
+                        continue
+                    break
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, calls = running.pop(future)
+                    try:
+                        future.result()
+                    except Exception as e:
+                        # Un fallo del batch entero (HTTP, conexión...) cuenta para sus peticiones pendientes
+                        for name, _ in calls:
+                            if name not in self._results and name not in self._errors:
+                                self._errors[name] = e
+                    finished.update(name for name, _ in chunks[index])
+
+        if self._errors or skipped:
+            raise BatchError(
+                "Han fallado %d peticiones del batch (%d no se han ejecutado)" % (len(self._errors), len(skipped)),
+                self._errors
+            )
+        return [self._results[name] for name, _ in self._calls]
+
+
+    def _runnable(self, chunk, skipped):
+        # Solo se saltan las peticiones que dependen (aunque sea indirectamente) de una fallida
+        calls = []
+        for name, request in chunk:
+            if any(dep in self._errors or dep in skipped for dep in self._deps[name]):
+                skipped.add(name)
+            else:
+                calls.append((name, request))
+        return calls
+
+
+    def _plan(self):
+        # Agrupa las peticiones relacionadas por dependencias (union-find)
+        parent = {}
+
+        def root(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for name, _ in self._calls:
+            parent[name] = name
+            for dep in self._deps[name]:
+                parent[root(dep)] = root(name)
+
+        groups = {}
+        for call in self._calls:
+            groups.setdefault(root(call[0]), []).append(call)
+
+        # Los grupos grandes se trocean en orden en chunks propios; los pequeños se empaquetan juntos
+        chunks, shared = [], []
+        for group in groups.values():
+            if len(group) > self.MAX_SIZE:
+                for start in range(0, len(group), self.MAX_SIZE):
+                    chunks.append(group[start:start + self.MAX_SIZE])
+                continue
+            for chunk in shared:
+                if len(chunk) + len(group) <= self.MAX_SIZE:
+                    chunk.extend(group)
+                    break
+            else:
+                shared.append(group)
+                chunks.append(group)
+        return chunks
+
+
+    def _executeChunk(self, chunk):
+        # Las peticiones que fallan con un error recuperable se repiten (con las que dependen de ellas)
+        attempt = 1
+        calls = chunk
+        while True:
+            self._sendChunk(calls)
+            retried = calls if attempt > 1 else []
+            calls, wait = self._retryable(chunk, attempt)
+            policy = YodaRetry.policy
+            if policy is not None:
+                key = policy.operationKey('POST', ())
+                for name, _ in retried:
+                    if name in self._results:
+                        policy.record(key, 'recovered')
+                if calls and not policy.allow(key):
+                    for name, _ in calls:
+                        policy.record(key, 'gave_up')
+                    calls = []
+            if not calls:
+                return
+            for name, _ in calls:
+                policy.record(key, 'retries', self._errors[name], attempt, wait)
+                del self._errors[name]
+            time.sleep(wait)
+            attempt += 1
+
+
+    def _retryable(self, chunk, attempt):
+        policy = YodaRetry.policy
+        if policy is None:
+            return [], None
+        names = set()
+        waits = []
+        for name, request in chunk:
+            error = self._errors.get(name)
+            if error is None:
+                continue
+            if names & set(self._deps[name]):
+                names.add(name)
+                continue
+            wait = policy.delay(error, attempt, request._method, request._path, request._params)
+            if wait is not None:
+                names.add(name)
+                waits.append(wait)
+        if not waits:
+            return [], None
+        return [call for call in chunk if call[0] in names], max(waits)
+
+
+    def _sendChunk(self, chunk):
+        batch = self._api.new_batch()
+        chunkNames = set()
+        for name, request in chunk:
+            # Las referencias a peticiones de batches anteriores se resuelven en local
+            request._params = self._resolve(request._params)
+            request._path = tuple(self._resolve(list(request._path)))
+            refs = [dep for dep in self._deps[name] if dep in chunkNames]
+            call = batch.add_request(
+                request,
+                success=self._onSuccess(name, request),
+                failure=self._onFailure(name),
+            )
+            call['name'] = name
+            call['omit_response_on_success'] = False
+            if refs:
+                call['depends_on'] = refs[-1]
+            chunkNames.add(name)
+
+        # Las respuestas vacías (timeouts internos) se reintentan una vez
+        retry = batch.execute()
+        if retry is not None:
+            retry = retry.execute()
+        if retry is not None:
+            raise BatchError("El batch no devolvió respuesta para %d peticiones" % len(retry))
+
+
+    def _onSuccess(self, name, request):
+        def callback(response):
+            data = response.json()
+            self._responses[name] = data
+            self._results[name] = self._parse(request, copy.deepcopy(data))
+        return callback
+
+
+    def _onFailure(self, name):
+        def callback(response):
+            self._errors[name] = response.error()
+        return callback
+
+
+    def _parse(self, request, data):
+        parser = request._response_parser
+        if parser is None:
+            return data
+        if request._api_type == 'EDGE' and request._method == 'GET':
+            return parser.parse_multiple(data)
+        return parser.parse_single(data)
+
+
+    def _references(self, value):
+        if isinstance(value, dict):
+            return [ref for v in value.values() for ref in self._references(v)]
+        if isinstance(value, list):
+            return [ref for v in value for ref in self._references(v)]
+        if isinstance(value, str):
+            return [match.group(1) for match in RESULT_REF.finditer(value)]
+        return []
+
+
+    def _resolve(self, value):
+        if isinstance(value, dict):
+            return dict((k, self._resolve(v)) for k, v in value.items())
+        if isinstance(value, list):
+            return [self._resolve(v) for v in value]
+        if isinstance(value, str):
+            return RESULT_REF.sub(self._resolveMatch, value)
+        return value
+
+
+    def _resolveMatch(self, match):
+        name, path = match.group(1), match.group(2)
+        if name not in self._responses:
+            return match.group(0)
+        data = self._responses[name]
+        for key in path.split('.'):
+            if key == '*' and isinstance(data, dict):
+                data = next(iter(data.values()))
+            elif isinstance(data, list):
+                data = data[int(key)]
+            else:
+                data = data[key]
+        return str(data)
@@ -0,0 +1,275 @@
+from .YodaFakeGraph import FakeGraph
+from .YodaBusiness import YodaBusiness
+from .YodaAccount import YodaAccount
+from .YodaNameIndex import clearNameIndexes
+from . import utils
+from . import YodaTracing
+from . import YodaThrottle
+from . import YodaRetry
+from .Exceptions import BatchError, ReportError
+from facebookads.objects import Campaign
+from facebookads.exceptions import FacebookRequestError
+import contextlib
+import statistics
+import tracemalloc
+import argparse
+import tempfile
+import shutil
+import json
+import warnings
+import time
+import io
+import os
+
+
+# Benchmarks de los flujos del wrapper contra FakeGraph: llamadas, round trips, tiempo y memoria pico
+# Uso: python -m package.YodaBenchmark --latency 50 --repeat 3
+
+KEYWORDS = ['running', 'yoga', 'cycling', 'swimming', 'hiking']
+
+
+class BenchmarkContext(object):
+
+    def __init__(self, graph, ads=10):
+        self.graph = graph
+        self.business = YodaBusiness(fbid=graph.businessId)
+        self.account = YodaAccount(graph.children(graph.businessId, 'owned_ad_accounts')[0]['id'])
+        self.campaign = Campaign(graph.children(self.account.get_id_assured(), 'campaigns')[0]['id'])
+        self.ads = ads
+        self.runs = 0
+        self.tmpdir = tempfile.mkdtemp()
+        self.images = []
+        for i in range(ads):
+            path = os.path.join(self.tmpdir, 'image%d.jpg' % i)
+            with open(path, 'wb') as f:
+                f.write(os.urandom(1024))
+            self.images.append(path)
+
+
+    def close(self):
+        shutil.rmtree(self.tmpdir, ignore_errors=True)
+
+
+    def accountSpec(self):
+        self.runs += 1
+        return {
+            'name': 'Benchmark %d' % self.runs,
+            'funding_id': '1',
+            'currency': 'EUR',
+            'page_id': '300',
+            'bid_amount': 100,
+            'country_code': 'ES',
+            'start_date': '2017-01-01T00:00:00+0000',
+            'end_date': '2017-02-01T00:00:00+0000',
+            'spend_cap': 100,
+            'keywords': KEYWORDS,
+            'ads': [{
+                'image_filename': image,
+                'message': 'message',
+                'headline': 'headline',
+                'description': 'description',
+                'caption': 'caption',
+                'url': 'https://example.com',
+            } for image in self.images],
+        }
+
+
+def benchCreateAccountStructure(ctx):
+    with contextlib.redirect_stdout(io.StringIO()):
+        ctx.business.createAccountStructure(ctx.accountSpec())
+
+
+def benchGetInterests(ctx):
+    if utils.searchCache is not None:
+        utils.searchCache.clear()
+    utils.getInterests(KEYWORDS)
+
+
+def benchGetAccountByName(ctx):
+    clearNameIndexes()
+    ctx.business.getAccountByName('Account 3')
+
+
+def benchGetCampaignByName(ctx):
+    clearNameIndexes()
+    ctx.account.getCampaignByName('Campaign 0-5')
+
+
+def benchGetProjectByName(ctx):
+    clearNameIndexes()
+    ctx.business.getProjectByName('Project 2')
+
+
+def benchInsights(ctx):
+    list(ctx.account.getCampaignInsights(ctx.campaign, page_size=25))
+
+
+def benchInsightsAsync(ctx):
+    list(ctx.account.getCampaignInsights(ctx.campaign, is_async=True, page_size=25))
+
+
+SCENARIOS = {
+    'createAccountStructure': benchCreateAccountStructure,
+    'getInterests': benchGetInterests,
+    'getAccountByName': benchGetAccountByName,
+    'getCampaignByName': benchGetCampaignByName,
+    'getProjectByName': benchGetProjectByName,
+    'getCampaignInsights': benchInsights,
+    'getCampaignInsightsAsync': benchInsightsAsync,
+}
+
+
+def measure(graph, ctx, bench, repeat):
+    times = []
+    peaks = []
+    stats = []
+    failures = {}
+    for i in range(repeat):
+        graph.reset()
+        tracemalloc.start()
+        start = time.perf_counter()
+        try:
+            bench(ctx)
+        except (FacebookRequestError, BatchError, ReportError) as e:
+            # Con rate_limit o error_rate los errores de la API son parte de lo que se mide; cualquier otro es un fallo del código
+            failures[type(e).__name__] = failures.get(type(e).__name__, 0) + 1
+        finally:
+            elapsed = time.perf_counter() - start
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        times.append(elapsed)
+        peaks.append(peak)
+        stats.append(graph.stats())
+    return {
+        'round_trips': stats[-1].get('round_trips', 0),
+        'calls': stats[-1].get('calls', 0),
+        'batches': stats[-1].get('batches', 0),
+        'throttled': stats[-1].get('throttled', 0),
+        'failures': sum(failures.values()),
+        'failure_types': failures,
+        'wall_median': statistics.median(times),
+        'wall_min': min(times),
+        'peak_kb': max(peaks) / 1024.0,
+    }
+
+
+def runBenchmarks(
+    scenarios=None,
+    repeat=3,
+    latency=0.0,
+    item_latency=0.0,
+    ads=10,
+    accounts=10,
+    campaigns=50,
+    projects=5,
+    page_size=25,
+    rate_limit=None,
+    error_rate=0.0,
+    trace=False,
+    throttle=False,
+    retry=False
+):
+    results = []
+    with FakeGraph(latency=latency, item_latency=item_latency, page_size=page_size, rate_limit=rate_limit, error_rate=error_rate) as graph:
+        graph.seed(accounts, campaigns, projects)
+        api = graph.connect()
+        tracer = YodaTracing.enableTracing(api) if trace else None
+        if throttle:
+            YodaThrottle.enableThrottling(api)
+        if retry:
+            YodaRetry.enableRetries(api)
+        ctx = BenchmarkContext(graph, ads)
+        # Caché en memoria: el benchmark la vacía y no debe tocar la de disco
+        searchCache = utils.searchCache
+        utils.configureSearchCache(path=None)
+        try:
+            for name in scenarios or SCENARIOS:
+                if tracer:
+                    tracer.reset()
+                result = measure(graph, ctx, SCENARIOS[name], repeat)
+                result['scenario'] = name
+                if tracer:
+                    run = tracer.lastRun()
+                    result['operations'] = tracer.operations()
+                    result['trace'] = tracer.format() + ('\n' + run.format() if run else '')
+                results.append(result)
+        finally:
+            ctx.close()
+            if trace:
+                YodaTracing.disableTracing(api)
+            if throttle:
+                YodaThrottle.disableThrottling(api)
+            if retry:
+                YodaRetry.disableRetries(api)
+            utils.searchCache = searchCache
+    return results
+
+
+def formatResults(results):
+    lines = ['%-26s %8s %8s %8s %8s %10s %10s %10s' % ('scenario', 'trips', 'calls', 'batches', 'failed', 'median_ms', 'min_ms', 'peak_kb')]
+    for r in results:
+        lines.append('%-26s %8d %8d %8d %8d %10.1f %10.1f %10.1f' % (
+            r['scenario'],
+            r['round_trips'],
+            r['calls'],
+            r['batches'],
+            r['failures'],
+            r['wall_median'] * 1000,
+            r['wall_min'] * 1000,
+            r['peak_kb'],
+        ))
+        if r['failure_types']:
+            lines[-1] += '  (%s)' % ', '.join('%s: %d' % item for item in sorted(r['failure_types'].items()))
+    return '\n'.join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmarks del wrapper contra una Graph API local')
+    parser.add_argument('scenarios', nargs='*', help='por defecto, todos: %s' % ', '.join(SCENARIOS))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--latency', type=float, default=0.0, help='milisegundos por round trip')
+    parser.add_argument('--item-latency', type=float, default=0.0, help='milisegundos por llamada dentro de un batch')
+    parser.add_argument('--ads', type=int, default=10)
+    parser.add_argument('--accounts', type=int, default=10)
+    parser.add_argument('--campaigns', type=int, default=50)
+    parser.add_argument('--page-size', type=int, default=25)
+    parser.add_argument('--rate-limit', type=int, default=None)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='proporción de errores transitorios del servidor')
+    parser.add_argument('--trace', action='store_true', help='muestra las trazas por operación')
+    parser.add_argument('--throttle', action='store_true', help='activa el reparto de llamadas según las cabeceras de uso')
+    parser.add_argument('--retry', action='store_true', help='activa los reintentos de errores transitorios')
+    parser.add_argument('--json', help='guarda los resultados en este fichero')
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error("escenario desconocido '%s'" % name)
+    # Los avisos de campos del SDK ensucian la salida
+    warnings.simplefilter('ignore', UserWarning)
+
+    results = runBenchmarks(
+        scenarios=args.scenarios or None,
+        repeat=args.repeat,
+        latency=args.latency / 1000.0,
+        item_latency=args.item_latency / 1000.0,
+        ads=args.ads,
+        accounts=args.accounts,
+        campaigns=args.campaigns,
+        page_size=args.page_size,
+        rate_limit=args.rate_limit,
+        error_rate=args.error_rate,
+        trace=args.trace,
+        throttle=args.throttle,
+        retry=args.retry,
+    )
+    print(formatResults(results))
+    for result in results:
+        if 'trace' in result:
+            print('\n[%s]\n%s' % (result['scenario'], result['trace']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == '__main__':
+    main()
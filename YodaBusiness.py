@@ -1,11 +1,14 @@
-from facebookads.api import FacebookAdsApi, FacebookRequest
+from facebookads.api import FacebookAdsApi
 from facebookads import objects
-from facebookads.adobjects.abstractcrudobject import AbstractCrudObject
-from facebookads.api import FacebookRequest
-from facebookads.typechecker import TypeChecker
-from facebookads.adobjects.objectparser import ObjectParser
 from .YodaAccount import YodaAccount
 from .YodaProject import Project
+from .YodaBatch import YodaBatch
+from .YodaJournal import Checkpoints
+from .YodaSync import planStructure
+from .YodaCursor import PrefetchCursor
+from .YodaNameIndex import getNameIndex
+from .YodaEdges import Edge
+from .YodaTracing import traced
 from . import utils
 from facebookads.objects import (
     Business,
@@ -34,7 +37,8 @@ class YodaBusiness(Business):
         insights_analyst = 'INSIGHTS_ANALYST'
 
 
-    def createAdAccount(self, name, funding_id, currency="EUR", timezone_id=1, partner="NONE", end_advertiser="NONE", media_agency="NONE"):
+    @traced()
+    def createAdAccount(self, name, funding_id, currency="EUR", timezone_id=1, partner="NONE", end_advertiser="NONE", media_agency="NONE", pending=False):
         params = {
             'currency': currency,
             'end_advertiser': end_advertiser,
@@ -44,11 +48,15 @@ class YodaBusiness(Business):
             'partner': partner,
             'timezone_id': timezone_id
         }
+        if pending:
+            return self.create_ad_account(params=params, pending=True)
         resp = self.create_ad_account(params=params)
+        self.accountNameIndex().add(name, resp.get_id_assured())
         return YodaAccount(resp.get_id_assured())
 
 
-    def createAccountStructure(self, acc, overwrite=False):
+    @traced(run=True)
+    def createAccountStructure(self, acc, overwrite=False, image_index=None, journal=None):
         ads = acc['ads']
         bid_amount = acc['bid_amount']
         country_code = acc['country_code']
@@ -61,249 +69,235 @@ class YodaBusiness(Business):
         spend_cap = acc['spend_cap']
         start_date = acc['start_date']
 
-        # Si existe cuenta con el mismo nombre la sobrescribe dependiendo de argumento 'overwrite'
-        account = self.getAccountByName(name)
-        if account and overwrite==False:
-            raise NameError("Ya existe una cuenta con ese nombre")
-        # Si no existe la crea
-        if not account:
-            account = self.createAdAccount(name, funding_id, currency)
+        # Con journal, cada objeto creado queda registrado y si se vuelve a ejecutar continúa donde se quedó
+        steps = journal.open(self.get_id_assured(), acc) if journal is not None else Checkpoints()
+
+        if 'account' in steps:
+            account = YodaAccount(steps.get('account'))
+        else:
+            # Si existe cuenta con el mismo nombre la sobrescribe dependiendo de argumento 'overwrite'
+            # (el índice se recarga: otro proceso puede haber creado la cuenta hace poco)
+            account = self.getAccountByName(name, max_age=0)
+            if account and overwrite==False:
+                raise NameError("Ya existe una cuenta con ese nombre")
+            # Si no existe la crea
+            if not account:
+                account = self.createAdAccount(name, funding_id, currency)
+            steps.record('account', account.get_id_assured())
         print(account)
-        account.assignAdAccount(self.get_id_assured())
+        if 'assigned' not in steps:
+            account.assignAdAccount(self.get_id_assured())
+            steps.record('assigned', True)
         #account.setSpendCap(spend_cap)
-        campaign = account.createCampaign(name)
+        if 'campaign' in steps:
+            campaign = Campaign(fbid=steps.get('campaign'))
+        else:
+            campaign = account.createCampaign(name)
+            steps.record('campaign', campaign.get_id_assured())
         print(campaign)
-        #get interests {id, name} by list of keywords
-        interests = utils.getInterests(keywords)
-        adset = account.createAdSet(campaign, name, bid_amount, start_date, end_date, country_code, daily_budget=spend_cap*100, interests=interests)
-
-        remoteAds = []
-        for ad in ads:
-            adImage = account.createAdImage(ad['image_filename'])
-            crea = account.createAdCreative(name,
-                adImage.get_hash(),
-                ad['message'],
-                ad['headline'],
-                ad['description'],
-                ad['caption'],
-                ad['url'],
-                page_id)
-            remoteAd = account.createAd(name, adset, crea, objects.Ad.Status.paused)
-            remoteAds.append(remoteAd)
+        if 'adset' in steps:
+            adset = AdSet(fbid=steps.get('adset'))
+        else:
+            #get interests {id, name} by list of keywords
+            interests = utils.getInterests(keywords)
+            adset = account.createAdSet(campaign, name, bid_amount, start_date, end_date, country_code, daily_budget=spend_cap*100, interests=interests)
+            steps.record('adset', adset.get_id_assured())
+
+        # Solo se suben las imágenes que no se subieron en una ejecución anterior
+        filepaths = [ad['image_filename'] for ad in ads]
+        missing = [filepath for filepath in filepaths if 'image:' + filepath not in steps]
+        if missing:
+            for filepath, imageHash in account.createAdImages(missing, index=image_index).items():
+                steps.record('image:' + filepath, imageHash)
+        imageHashes = dict((filepath, steps.get('image:' + filepath)) for filepath in filepaths)
+
+        # Creatividades y anuncios en batch: cada anuncio referencia el resultado de su creatividad
+        batch = YodaBatch(api=account.get_api_assured())
+        for i, ad in enumerate(ads):
+            creaName, adName = 'creative%d' % i, 'ad%d' % i
+            if adName in steps:
+                continue
+            if creaName in steps:
+                crea, depends_on = {'creative_id': steps.get(creaName)}, None
+            else:
+                batch.add(account.createAdCreative(name,
+                    imageHashes[ad['image_filename']],
+                    ad['message'],
+                    ad['headline'],
+                    ad['description'],
+                    ad['caption'],
+                    ad['url'],
+                    page_id,
+                    pending=True), name=creaName)
+                crea, depends_on = {'creative_id': YodaBatch.resultRef(creaName)}, creaName
+            batch.add(account.createAd(name, adset, crea, objects.Ad.Status.paused, pending=True), name=adName, depends_on=depends_on)
+        try:
+            if len(batch):
+                batch.execute()
+        finally:
+            # También si ha fallado parte del batch: lo que se creó no se vuelve a crear
+            for i in range(len(ads)):
+                for stepName in ('creative%d' % i, 'ad%d' % i):
+                    if stepName not in steps and batch.hasResult(stepName):
+                        steps.record(stepName, batch.getResult(stepName).get_id_assured())
+
+        remoteAds = [Ad(fbid=steps.get('ad%d' % i)) for i in range(len(ads))]
         for ad in remoteAds:
             print(ad)
 
 
-    def getAccountByName(self, name):
-        allAccounts = self.get_owned_ad_accounts({AdAccount.Field.name})
-        account = None
-        variasOcurrencias = False
-        for acc in allAccounts:
-            if acc[AdAccount.Field.name] == name:
-                if account:
-                    raise LookupError("Hay más de una cuenta con el mismo nombre")
-                account = acc
+    @traced(run=True)
+    def planAccountStructure(self, acc, image_index=None, refresh_interests=False):
+        # Cambios necesarios para que la cuenta ya creada coincida con 'acc'; plan.apply() los ejecuta
+        account = self.getAccountByName(acc['name'])
         if not account:
+            raise LookupError("No existe una cuenta con ese nombre")
+        return planStructure(account, acc, image_index, refresh_interests=refresh_interests)
+
+
+    @traced(run=True)
+    def syncAccountStructure(self, acc, image_index=None, refresh_interests=False):
+        plan = self.planAccountStructure(acc, image_index, refresh_interests)
+        plan.apply()
+        return plan
+
+
+    @traced()
+    def getAccountByName(self, name, page_size=100, max_pages=2, max_age=600):
+        accountId = self.accountNameIndex(page_size, max_pages, max_age).get(name)
+        if not accountId:
             return None
-        return YodaAccount(account.get_id_assured())
+        return YodaAccount(accountId)
+
+
+    def getAccountsInfo(self, profile='status', page_size=100, max_pages=2):
+        # Todas las cuentas del business con los campos del perfil, página a página
+        fields = YodaAccount.FIELD_PROFILES[profile]
+        accounts = self.get_owned_ad_accounts(fields, params={'limit': page_size})
+        for account in PrefetchCursor(accounts, max_pages):
+            yield account.export_all_data()
 
 
-    def claimPage(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    def accountNameIndex(self, page_size=100, max_pages=2, max_age=600):
+        # Índice nombre -> id compartido por todas las instancias de este business
+        loader = lambda: PrefetchCursor(
+            self.get_owned_ad_accounts({AdAccount.Field.name}, params={'limit': page_size}),
+            max_pages
+        )
+        return getNameIndex(self.get_id_assured(), 'owned_ad_accounts', loader, "Hay más de una cuenta con el mismo nombre", max_age)
+
+
+    claimPage = Edge(
+        method='POST',
+        endpoint='/pages',
+        param_types={
             'page_id': 'string',
             'access_type': 'access_type_enum',
             'user': 'string',
             'permitted_roles': 'list<permitted_roles_enum>'
-        }
-        enums = {
+        },
+        enums={
             'access_type_enum': [
                 'OWNER',
                 'AGENCY'
             ],
-            'permitted_roles_enum': self.Roles.__dict__.values()
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='POST',
-            endpoint='/pages',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='EDGE',
-            response_parser=ObjectParser(target_class=AbstractCrudObject),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+            'permitted_roles_enum': Roles.__dict__.values()
+        },
+    )
 
 
-    def requestPageAccess(self, page_id):
+    @traced()
+    def requestPageAccess(self, page_id, pending=False):
         params = {
             'page_id': page_id,
             'access_type': 'AGENCY',
             'permitted_roles': ['ADVERTISER', 'INSIGHTS_ANALYST'],
             'user': utils.getCurrentAccountId()
         }
-        resp = self.claimPage(params=params)
+        resp = self.claimPage(params=params, pending=pending)
         return resp
 
 
-    def assign_people_to_page(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    assign_people_to_page = Edge(
+        method='POST',
+        endpoint='/userpermissions',
+        param_types={
             'business': 'string',
             'role': 'role_enum',
             'user': 'string',
             'page_id': 'string'
-        }
-        enums = {
-            'role_enum': self.Roles.__dict__.values()
-        }
-        if 'page_id' not in params:
-            raise AttributeError("Debes especificar 'page_id' como parámetro")
-        request = FacebookRequest(
-            node_id=params['page_id'],
-            method='POST',
-            endpoint='/userpermissions',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='EDGE',
-            response_parser=ObjectParser(target_class=AbstractCrudObject),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+        },
+        enums={
+            'role_enum': Roles.__dict__.values()
+        },
+        node_id=lambda business, params: params['page_id'],
+        required=['page_id'],
+    )
 
 
-    def assignPage(self, page_id):
+    @traced()
+    def assignPage(self, page_id, pending=False):
         params = {
             'business': self.get_id_assured(),
             'role': self.Roles.advertiser,
             'user': utils.getCurrentAccountId(),
             'page_id': page_id
         }
-        resp = self.assign_people_to_page(params=params)
+        resp = self.assign_people_to_page(params=params, pending=pending)
         return resp
 
 
-    def checkPagesStatus(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self.get_id_assured(),
-            method='GET',
-            endpoint='/pages',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='EDGE',
-            response_parser=ObjectParser(target_class=AbstractCrudObject),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+    checkPagesStatus = Edge(
+        method='GET',
+        endpoint='/pages',
+    )
 
 
-    def create_project(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    create_project = Edge(
+        method='POST',
+        endpoint='/businessprojects',
+        param_types={
             'name': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self.get_id_assured(),
-            method='POST',
-            endpoint='/businessprojects',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=Project,
-            api_type='EDGE',
-            response_parser=ObjectParser(target_class=AbstractCrudObject),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+        },
+        target_class=Project,
+    )
 
 
-    def createProject(self, name):
-        return self.create_project(params={'name': name})
+    @traced()
+    def createProject(self, name, pending=False):
+        if pending:
+            return self.create_project(params={'name': name}, pending=True)
+        project = self.create_project(params={'name': name})
+        self.projectNameIndex().add(name, project['id'])
+        return project
 
 
-    def get_projects(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self.get_id_assured(),
-            method='GET',
-            endpoint='/businessprojects',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=Project,
-            api_type='EDGE',
-            response_parser=ObjectParser(target_class=AbstractCrudObject),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
-
-
-    def getProjectByName(self, name):
-        projects = self.get_projects()
-        project = None
-        for proj in projects:
-            if proj['name'] == name:
-                if project:
-                    raise LookupError("Hay más de una cuenta con el mismo nombre")
-                project = proj
+    get_projects = Edge(
+        method='GET',
+        endpoint='/businessprojects',
+        target_class=Project,
+    )
+
+
+    @traced()
+    def getProjectByName(self, name, page_size=100, max_pages=2, max_age=600):
+        projectId = self.projectNameIndex(page_size, max_pages, max_age).get(name)
+        if not projectId:
+            return None
+        project = Project(fbid=projectId)
+        project.set_data({'name': name})
         return project
 
 
-    def create_page(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    def projectNameIndex(self, page_size=100, max_pages=2, max_age=600):
+        loader = lambda: PrefetchCursor(self.get_projects(params={'limit': page_size}), max_pages)
+        return getNameIndex(self.get_id_assured(), 'businessprojects', loader, "Hay más de un proyecto con el mismo nombre", max_age)
+
+
+    create_page = Edge(
+        method='POST',
+        endpoint='/accounts',
+        param_types={
             'about': 'string',
             'address': 'string',
             'category': 'int',
@@ -320,35 +314,15 @@ class YodaBusiness(Business):
             'picture': 'string',
             'website': 'string',
             'zip': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=utils.getCurrentAccountId(),
-            method='POST',
-            endpoint='/accounts',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='EDGE',
-            response_parser=ObjectParser(target_class=AbstractCrudObject),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+        },
+        node_id=lambda business, params: utils.getCurrentAccountId(business.get_api()),
+    )
 
 
-    def createPage(self, name, category_id):
+    @traced()
+    def createPage(self, name, category_id, pending=False):
         params = {
             'name': name,
             'category_enum': category_id
         }
-        return self.create_page(params=params)
\ No newline at end of file
+        return self.create_page(params=params, pending=pending)
\ No newline at end of file
@@ -0,0 +1,69 @@
+from .YodaTracing import bindContext
+import queue
+import threading
+
+
+class PrefetchCursor(object):
+
+    def __init__(self, cursor, max_pages=2):
+        # Un hilo carga la página siguiente mientras se consume la actual; como mucho max_pages en memoria
+        self._pages = queue.Queue(maxsize=max_pages)
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=bindContext(self._fetch), args=(cursor,))
+        self._thread.daemon = True
+        self._thread.start()
+
+
+    def __iter__(self):
+        # Si se deja de iterar antes de terminar (return, break o una excepción) se para el hilo
+        try:
+            while True:
+                page = self._pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for obj in page:
+                    yield obj
+        finally:
+            self.close()
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+
+    def close(self):
+        self._stopped.set()
+
+
+    def _fetch(self, cursor):
+        try:
+            # El Cursor carga la página siguiente cuando se acaba la actual; len(cursor) es lo que queda de esta
+            page = []
+            for obj in cursor:
+                page.append(obj)
+                if not len(cursor):
+                    if not self._put(page):
+                        return
+                    page = []
+            if page and not self._put(page):
+                return
+        except Exception as e:
+            self._put(e)
+        self._put(None)
+
+
+    def _put(self, item):
+        while not self._stopped.is_set():
+            try:
+                self._pages.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
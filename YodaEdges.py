@@ -0,0 +1,84 @@
+from facebookads.api import FacebookRequest
+from facebookads.typechecker import TypeChecker
+from facebookads.adobjects.objectparser import ObjectParser
+from facebookads.adobjects.abstractcrudobject import AbstractCrudObject
+from .YodaTracing import operation
+import functools
+
+
+# Registro de todos los edges declarados, por 'Clase.metodo'
+EDGES = {}
+
+
+class Edge(object):
+
+    def __init__(
+        self,
+        method,
+        endpoint,
+        param_types=None,
+        enums=None,
+        target_class=AbstractCrudObject, # None: la propia clase en la que se declara
+        api_type='EDGE',
+        parser_class=AbstractCrudObject, # None: el parser reutiliza el propio objeto
+        node_id=None, # callable(obj, params) si el nodo no es el propio objeto
+        required=None
+    ):
+        self.method = method
+        self.endpoint = endpoint
+        self.target_class = target_class
+        self.api_type = api_type
+        self.node_id = node_id
+        self.required = required or []
+        self.name = None
+        self.qualname = None
+        # El checker y el parser (si no depende del objeto) se crean una sola vez
+        self.param_checker = TypeChecker(param_types or {}, enums or {})
+        self.response_parser = ObjectParser(target_class=parser_class) if parser_class else None
+
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        self.qualname = '%s.%s' % (owner.__name__, name)
+        if self.target_class is None:
+            self.target_class = owner
+        EDGES[self.qualname] = self
+
+
+    def __get__(self, obj, owner):
+        if obj is None:
+            return self
+        return functools.partial(self.call, obj)
+
+
+    def request(self, obj, fields=None, params=None):
+        for param in self.required:
+            if not params or param not in params:
+                raise AttributeError("Debes especificar '%s' como parámetro" % param)
+        request = FacebookRequest(
+            node_id=self.node_id(obj, params) if self.node_id else obj['id'],
+            method=self.method,
+            endpoint=self.endpoint,
+            api=obj._api,
+            param_checker=self.param_checker,
+            target_class=self.target_class,
+            api_type=self.api_type,
+            response_parser=self.response_parser or ObjectParser(reuse_object=obj),
+        )
+        request.add_params(params)
+        request.add_fields(fields)
+        return request
+
+
+    def call(self, obj, fields=None, params=None, batch=None, pending=False):
+        request = self.request(obj, fields, params)
+
+        if batch is not None:
+            request.add_to_batch(batch)
+            return request
+        elif pending:
+            return request
+        else:
+            obj.assure_call()
+            with operation(self.qualname):
+                return request.execute()
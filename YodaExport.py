@@ -0,0 +1,211 @@
+import csv
+import json
+import os
+import tempfile
+
+
+# Columnas de métricas que se exportan como números
+NUMERIC_FIELDS = {
+    'impressions': int,
+    'reach': int,
+    'clicks': int,
+    'website_clicks': int,
+    'app_store_clicks': int,
+    'deeplink_clicks': int,
+    'spend': float,
+    'cpc': float,
+    'cpm': float,
+    'ctr': float,
+    'frequency': float,
+}
+
+# Listas de {action_type, value} que se aplanan en una columna por tipo de acción
+ACTION_FIELDS = ('actions', 'action_values')
+
+
+def toNumber(value, numberType=float):
+    if value is None or value == '':
+        return None
+    return numberType(float(value)) if numberType is int else numberType(value)
+
+
+def flattenInsightsRow(row):
+    flat = {}
+    for key, value in dict(row).items():
+        if key in ACTION_FIELDS:
+            for action in value or []:
+                flat['%s_%s' % (key, action['action_type'])] = toNumber(action.get('value'))
+        elif key in NUMERIC_FIELDS:
+            flat[key] = toNumber(value, NUMERIC_FIELDS[key])
+        elif isinstance(value, (dict, list)):
+            flat[key] = json.dumps(value, sort_keys=True)
+        else:
+            flat[key] = value
+    return flat
+
+
+def exportInsights(rows, path, file_format='csv', chunk_size=1000, columns=None):
+    # Solo se mantiene en memoria un bloque de chunk_size filas; el cursor pide las páginas según se consumen.
+    # En csv y parquet sin 'columns' las filas pasan por un fichero temporal y se escriben al cerrar con todas
+    # las columnas vistas (p. ej. tipos de acción que solo aparecen en filas posteriores).
+    writers = {
+        'csv': CsvWriter,
+        'jsonl': JsonlWriter,
+        'parquet': ParquetWriter,
+    }
+    if file_format not in writers:
+        raise ValueError("Formato de exportación no soportado: '%s'" % file_format)
+
+    if columns or file_format == 'jsonl':
+        writer = writers[file_format](path, columns)
+    else:
+        writer = SpooledWriter(writers[file_format], path, chunk_size)
+    count = 0
+    chunk = []
+    try:
+        for row in rows:
+            chunk.append(flattenInsightsRow(row))
+            if len(chunk) >= chunk_size:
+                writer.write(chunk)
+                count += len(chunk)
+                chunk = []
+        if chunk:
+            writer.write(chunk)
+            count += len(chunk)
+    finally:
+        writer.close()
+    return count
+
+
+def _columns(chunk):
+    columns = []
+    seen = set()
+    for row in chunk:
+        for key in row:
+            if key not in seen:
+                seen.add(key)
+                columns.append(key)
+    return columns
+
+
+class JsonlWriter(object):
+
+    def __init__(self, path, columns=None):
+        self._file = open(path, 'w')
+        self._columns = columns
+
+
+    def write(self, chunk):
+        for row in chunk:
+            if self._columns:
+                row = dict((column, row.get(column)) for column in self._columns)
+            self._file.write(json.dumps(row) + '\n')
+        self._file.flush()
+
+
+    def close(self):
+        self._file.close()
+
+
+class CsvWriter(object):
+
+    def __init__(self, path, columns=None):
+        self._file = open(path, 'w', newline='')
+        self._columns = columns
+        self._writer = None
+
+
+    def write(self, chunk):
+        if self._writer is None:
+            self._columns = self._columns or _columns(chunk)
+            self._writer = csv.DictWriter(self._file, fieldnames=self._columns, extrasaction='ignore')
+            self._writer.writeheader()
+        self._writer.writerows(chunk)
+        self._file.flush()
+
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter(object):
+
+    def __init__(self, path, columns=None):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError("La exportación a parquet necesita el paquete 'pyarrow'")
+        self._pa = pyarrow
+        self._pq = pyarrow.parquet
+        self._path = path
+        self._columns = columns
+        self._writer = None
+
+
+    def write(self, chunk):
+        if self._writer is None:
+            self._columns = self._columns or _columns(chunk)
+            fields = []
+            for column in self._columns:
+                if NUMERIC_FIELDS.get(column) is int:
+                    fieldType = self._pa.int64()
+                elif column in NUMERIC_FIELDS or column.startswith(tuple('%s_' % f for f in ACTION_FIELDS)):
+                    fieldType = self._pa.float64()
+                else:
+                    fieldType = self._pa.string()
+                fields.append(self._pa.field(column, fieldType))
+            self._schema = self._pa.schema(fields)
+            self._writer = self._pq.ParquetWriter(self._path, self._schema)
+        data = dict(
+            (column, [self._cell(row.get(column), field.type) for row in chunk])
+            for column, field in zip(self._columns, self._schema)
+        )
+        self._writer.write_table(self._pa.Table.from_pydict(data, schema=self._schema))
+
+
+    def _cell(self, value, fieldType):
+        if value is None or fieldType != self._pa.string():
+            return value
+        return str(value)
+
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+
+class SpooledWriter(object):
+
+    # Guarda las filas en un fichero temporal junto al destino y al cerrar las escribe con todas las columnas
+    def __init__(self, writerClass, path, chunk_size=1000):
+        self._writerClass = writerClass
+        self._path = path
+        self._chunkSize = chunk_size
+        self._spool = tempfile.TemporaryFile('w+', dir=os.path.dirname(os.path.abspath(path)))
+        self._columns = []
+
+
+    def write(self, chunk):
+        self._columns.extend(column for column in _columns(chunk) if column not in self._columns)
+        for row in chunk:
+            self._spool.write(json.dumps(row) + '\n')
+
+
+    def close(self):
+        try:
+            writer = self._writerClass(self._path, self._columns)
+            try:
+                self._spool.seek(0)
+                chunk = []
+                for line in self._spool:
+                    chunk.append(json.loads(line))
+                    if len(chunk) >= self._chunkSize:
+                        writer.write(chunk)
+                        chunk = []
+                if chunk:
+                    writer.write(chunk)
+            finally:
+                writer.close()
+        finally:
+            self._spool.close()
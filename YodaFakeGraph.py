@@ -0,0 +1,567 @@
+from facebookads.api import FacebookAdsApi
+from facebookads.session import FacebookSession
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlsplit, parse_qsl, urlencode, unquote
+from collections import Counter, deque
+import threading
+import random
+import gzip
+import json
+import time
+import zlib
+import re
+
+
+# Servidor local que imita la parte de la Graph API que usa el wrapper, para medir sin llamar a Facebook
+
+RESULT_REF = re.compile(r'\{result=([^:}]+):\$\.([^}]+)\}')
+
+# Edge de creación -> edge donde queda listado el objeto
+CREATE_EDGES = {
+    'adaccount': 'owned_ad_accounts',
+}
+
+
+class FakeGraph(object):
+
+    def __init__(
+        self,
+        latency=0.0, # segundos por petición HTTP
+        item_latency=0.0, # segundos adicionales por llamada dentro de un batch
+        page_size=25, # tamaño de página si la petición no trae 'limit'
+        rate_limit=None, # llamadas permitidas por cuenta publicitaria en cada ventana
+        app_rate_limit=None, # llamadas permitidas a la app (todas las cuentas) en cada ventana
+        rate_window=60,
+        error_rate=0.0, # proporción de errores transitorios aleatorios
+        insights_rows=30,
+        seed=0
+    ):
+        self.latency = latency
+        self.itemLatency = item_latency
+        self.pageSize = page_size
+        self.rateLimit = rate_limit
+        self.appRateLimit = app_rate_limit
+        self.rateWindow = rate_window
+        self.errorRate = error_rate
+        self.insightsRows = insights_rows
+        self.userId = '100'
+        self.businessId = '200'
+
+        self._random = random.Random(seed)
+        self._lock = threading.RLock()
+        self._objects = {}
+        self._edges = {}
+        self._nextId = 1000
+        self._calls = {}
+        self._stats = Counter()
+        self._server = None
+        self._thread = None
+        self._previousGraph = None
+
+        self._objects[self.userId] = {'id': self.userId, 'name': 'Fake User'}
+        self._objects[self.businessId] = {'id': self.businessId, 'name': 'Fake Business'}
+
+
+    def __enter__(self):
+        return self.start()
+
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+        return False
+
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return 'http://%s:%d' % (host, port)
+
+
+    def start(self, host='127.0.0.1', port=0):
+        graph = self
+
+        class Handler(FakeGraphHandler):
+            server_graph = graph
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+
+    def stop(self):
+        self.disconnect()
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+
+    def connect(self, api=None, access_token='fake-token'):
+        # TargetingSearch y el cliente asíncrono leen la URL de la clase, así que se cambia ahí
+        if self._previousGraph is None:
+            self._previousGraph = FacebookSession.GRAPH
+        FacebookSession.GRAPH = self.url
+        if api is None:
+            api = FacebookAdsApi.init(access_token=access_token)
+        return api
+
+
+    def disconnect(self):
+        if self._previousGraph is not None:
+            FacebookSession.GRAPH = self._previousGraph
+            self._previousGraph = None
+
+
+    # Datos
+
+    def newId(self, prefix=''):
+        with self._lock:
+            self._nextId += 1
+            return '%s%d' % (prefix, self._nextId)
+
+
+    def create(self, parent_id, edge, data):
+        with self._lock:
+            if edge == 'adaccount':
+                fbid = self.newId('act_')
+                data = dict(data, account_id=fbid[4:])
+            else:
+                fbid = self.newId()
+            obj = dict(data, id=fbid)
+            obj.setdefault('status', 'PAUSED')
+            obj.setdefault('effective_status', obj['status'])
+            obj['updated_time'] = time.strftime('%Y-%m-%dT%H:%M:%S+0000', time.gmtime())
+            self._objects[fbid] = obj
+            self.link(parent_id, CREATE_EDGES.get(edge, edge), fbid)
+            return obj
+
+
+    def link(self, parent_id, edge, fbid):
+        with self._lock:
+            ids = self._edges.setdefault((parent_id, edge), [])
+            if fbid not in ids:
+                ids.append(fbid)
+
+
+    def unlink(self, parent_id, edge, fbid):
+        with self._lock:
+            ids = self._edges.get((parent_id, edge), [])
+            if fbid in ids:
+                ids.remove(fbid)
+
+
+    def children(self, parent_id, edge):
+        with self._lock:
+            return [self._objects.get(fbid, {'id': fbid}) for fbid in self._edges.get((parent_id, edge), [])]
+
+
+    def seed(self, accounts=10, campaigns=20, projects=5):
+        # Estructura inicial para las búsquedas por nombre
+        for i in range(accounts):
+            account = self.create(self.businessId, 'adaccount', {'name': 'Account %d' % i, 'account_status': 1})
+            for j in range(campaigns):
+                self.create(account['id'], 'campaigns', {'name': 'Campaign %d-%d' % (i, j), 'objective': 'LINK_CLICKS'})
+        for i in range(projects):
+            self.create(self.businessId, 'businessprojects', {'name': 'Project %d' % i})
+        return self
+
+
+    # Estadísticas
+
+    def stats(self):
+        with self._lock:
+            return dict(self._stats)
+
+
+    def reset(self):
+        with self._lock:
+            self._stats.clear()
+            self._calls.clear()
+
+
+    def _count(self, key, value=1):
+        with self._lock:
+            self._stats[key] += value
+
+
+    def _limit(self, bucket):
+        return self.appRateLimit if bucket == 'app' else self.rateLimit
+
+
+    def _usage(self, bucket):
+        # Porcentaje de uso de la ventana actual, como en las cabeceras X-*-Usage
+        with self._lock:
+            calls = self._calls.setdefault(bucket, deque())
+            now = time.time()
+            while calls and calls[0] <= now - self.rateWindow:
+                calls.popleft()
+            limit = self._limit(bucket)
+            if not limit:
+                return 0, 0
+            regain = int(calls[0] + self.rateWindow - now) + 1 if len(calls) >= limit else 0
+            return min(100, int(100 * len(calls) / limit)), regain
+
+
+    def _throttle(self, buckets):
+        # Devuelve el bucket que ha superado su límite; si ninguno, la llamada cuenta en todos
+        with self._lock:
+            for bucket in buckets:
+                limit = self._limit(bucket)
+                self._usage(bucket)
+                if limit and len(self._calls[bucket]) >= limit:
+                    self._count('throttled')
+                    return bucket
+            for bucket in buckets:
+                self._calls[bucket].append(time.time())
+            return None
+
+
+    def usageHeaders(self, bucket):
+        pct, regain = self._usage('app')
+        headers = {
+            'X-App-Usage': json.dumps({'call_count': pct, 'total_cputime': pct, 'total_time': pct}),
+        }
+        if bucket.startswith('act_'):
+            pct, regain = self._usage(bucket)
+            headers['X-Business-Use-Case-Usage'] = json.dumps({bucket[4:]: [{
+                'type': 'ads_management',
+                'call_count': pct,
+                'total_cputime': pct,
+                'total_time': pct,
+                'estimated_time_to_regain_access': (regain + 59) // 60,
+            }]})
+            headers['X-Ad-Account-Usage'] = json.dumps({'acc_id_util_pct': pct})
+        return headers
+
+
+    # Peticiones
+
+    def handle(self, method, path, params, files=()):
+        # Devuelve (status, body, headers); se usa tanto para peticiones HTTP como para cada llamada de un batch
+        parts = [p for p in path.strip('/').split('/') if p]
+        if parts and re.match(r'^v\d+\.\d+$', parts[0]):
+            parts = parts[1:]
+        bucket = parts[0] if parts and parts[0].startswith('act_') else 'app'
+
+        self._count('calls')
+        self._count('%s /%s' % (method, '/'.join(_pattern(p) for p in parts)))
+
+        throttled = self._throttle(['app', bucket] if bucket != 'app' else ['app'])
+        if throttled:
+            if throttled == 'app':
+                return 400, _error('Application request limit reached', 4, transient=True), self.usageHeaders(bucket)
+            return 400, _error('There have been too many calls to this ad-account.', 80004, 2446079, True), self.usageHeaders(bucket)
+        if self.errorRate and self._random.random() < self.errorRate:
+            self._count('errors')
+            return 500, _error('An unexpected error has occurred. Please retry your request later.', 2, transient=True), self.usageHeaders(bucket)
+
+        try:
+            body = self._dispatch(method, parts, params, files)
+        except LookupError as e:
+            return 400, _error(str(e), 100, 33), self.usageHeaders(bucket)
+        return 200, body, self.usageHeaders(bucket)
+
+
+    def _dispatch(self, method, parts, params, files):
+        if not parts:
+            if 'ids' in params:
+                return dict((fbid, self._read(fbid, params)) for fbid in params['ids'].split(','))
+            raise LookupError('Unsupported request')
+        if parts == ['search']:
+            return {'data': self._search(params)}
+        if parts[0] == 'me':
+            parts = [self.userId] + parts[1:]
+
+        node = parts[0]
+        if len(parts) == 1:
+            if method == 'GET':
+                return self._read(node, params)
+            with self._lock:
+                if node not in self._objects:
+                    raise LookupError("Object with ID '%s' does not exist" % node)
+                if method == 'DELETE':
+                    del self._objects[node]
+                    # Como en la API, lo borrado deja de aparecer en los edges
+                    for ids in self._edges.values():
+                        if node in ids:
+                            ids.remove(node)
+                else:
+                    self._objects[node].update(_decode(params))
+                    if 'status' in params:
+                        self._objects[node]['effective_status'] = params['status']
+            return {'success': True}
+
+        edge = parts[1]
+        if edge == 'insights':
+            return self._insights(method, node, params)
+        if edge == 'permissions':
+            return {'data': [{'permission': 'ads_management', 'status': 'granted'}, {'permission': 'business_management', 'status': 'granted'}]}
+        if method == 'GET':
+            return self._list(node, edge, params)
+        if method == 'DELETE':
+            for key in ('page_id', 'adaccount_id'):
+                if key in params:
+                    self.unlink(node, edge, params[key])
+            return {'success': True}
+        return self._post(node, edge, params, files)
+
+
+    def _read(self, fbid, params):
+        with self._lock:
+            if fbid not in self._objects:
+                raise LookupError("Object with ID '%s' does not exist" % fbid)
+            return _select(self._objects[fbid], params.get('fields'))
+
+
+    def _list(self, node, edge, params):
+        objs = self.children(node, edge)
+        for condition in _loads(params.get('filtering')) or []:
+            objs = [obj for obj in objs if _matches(obj, condition)]
+        limit = int(params.get('limit') or self.pageSize)
+        offset = int(params.get('after') or 0)
+        page = [_select(obj, params.get('fields')) for obj in objs[offset:offset + limit]]
+        response = {'data': page}
+        if offset + limit < len(objs):
+            query = dict(params, after=str(offset + limit))
+            response['paging'] = {
+                'cursors': {'after': str(offset + limit)},
+                'next': '%s/%s/%s?%s' % (self.url, node, edge, urlencode(query)),
+            }
+        return response
+
+
+    def _post(self, node, edge, params, files):
+        if edge == 'adimages':
+            images = {}
+            for filename in list(files) or [params.get('filename', 'image')]:
+                image = self.create(node, 'adimages', {'name': filename, 'hash': '%08x' % zlib.crc32(filename.encode())})
+                images[filename] = {'hash': image['hash'], 'url': 'https://example.com/%s' % image['hash']}
+            return {'images': images}
+        if edge == 'userpermissions':
+            return {'success': True}
+        if edge in ('pages', 'adaccounts') and ('page_id' in params or 'adaccount_id' in params):
+            self.link(node, edge, params.get('page_id') or params.get('adaccount_id'))
+            return {'success': True}
+        params = _decode(params)
+        if edge == 'ads':
+            # El anuncio hereda la campaña de su conjunto
+            adset = self._objects.get(params.get('adset_id'))
+            if adset and 'campaign_id' in adset:
+                params['campaign_id'] = adset['campaign_id']
+        obj = self.create(node, edge, params)
+        return {'id': obj['id']}
+
+
+    def _search(self, params):
+        searchType = params.get('type')
+        if searchType == 'adinterest':
+            q = params.get('q', '')
+            return [_interest('%s %d' % (q, i)) for i in range(5)]
+        if searchType == 'adinterestvalid':
+            return [dict(_interest(name), valid=True) for name in _loads(params.get('interest_list')) or []]
+        if searchType == 'adinterestsuggestion':
+            return [_interest('%s related' % name) for name in (_loads(params.get('interest_list')) or [])[:10]]
+        if searchType == 'adTargetingCategory':
+            categories = []
+            for i in range(5):
+                for j in range(4):
+                    for k in range(3):
+                        path = ['Category %d' % i, 'Topic %d.%d' % (i, j), 'Interest %d.%d.%d' % (i, j, k)]
+                        categories.append(dict(_interest(path[-1]), path=path, type='interests'))
+            return categories
+        return []
+
+
+    def _insights(self, method, node, params):
+        if method == 'POST':
+            report = self.create(node, 'reports', {'async_status': 'Job Completed', 'async_percent_completion': 100, 'source': node})
+            return {'report_run_id': report['id']}
+        source = self._objects.get(node, {}).get('source', node)
+        rows = []
+        for i in range(self.insightsRows):
+            rows.append({
+                'campaign_name': 'Campaign %s' % source,
+                'adset_name': 'AdSet %d' % (i % 5),
+                'adset_id': str(i % 5),
+                'impressions': str(1000 + i),
+                'website_clicks': str(10 + i),
+                'app_store_clicks': '0',
+                'deeplink_clicks': '0',
+                'spend': '%.2f' % (1.5 * i),
+                'reach': str(900 + i),
+                'actions': [{'action_type': 'link_click', 'value': str(i)}],
+                'action_values': [{'action_type': 'link_click', 'value': '%.2f' % (0.5 * i)}],
+                'date_start': '2017-01-01',
+                'date_stop': '2017-01-07',
+            })
+        limit = int(params.get('limit') or self.pageSize)
+        offset = int(params.get('after') or 0)
+        response = {'data': [_select(row, params.get('fields')) for row in rows[offset:offset + limit]]}
+        if offset + limit < len(rows):
+            response['paging'] = {
+                'cursors': {'after': str(offset + limit)},
+                'next': '%s/%s/insights?%s' % (self.url, node, urlencode(dict(params, after=str(offset + limit)))),
+            }
+        return response
+
+
+    def batch(self, calls, files):
+        # Cada llamada cuenta para el límite de su cuenta; las referencias {result=...} se resuelven en orden
+        self._count('batches')
+        results = {}
+        responses = []
+        for call in calls:
+            self._count('batch_items')
+            if self.itemLatency:
+                time.sleep(self.itemLatency)
+            dependency = call.get('depends_on')
+            if dependency and (dependency not in results or results[dependency][0] != 200):
+                responses.append({'code': 400, 'headers': [], 'body': json.dumps(_error('Dependent call failed', 100))})
+                continue
+            # Las referencias se resuelven ya decodificadas (pueden ir dentro de un parámetro JSON)
+            resolve = lambda value: RESULT_REF.sub(lambda m: _resolve(results, m.group(1), m.group(2)), value)
+            split = urlsplit(call['relative_url'])
+            params = dict((key, resolve(value)) for key, value in parse_qsl(split.query))
+            params.update((key, resolve(value)) for key, value in parse_qsl(call.get('body', '')))
+            attached = [name for name in call.get('attached_files', '').split(',') if name]
+            status, result, headers = self.handle(call['method'], resolve(unquote(split.path)), params, [files[name] for name in attached if name in files])
+            if call.get('name'):
+                results[call['name']] = (status, result)
+            if status == 200 and call.get('omit_response_on_success', True) and call.get('name'):
+                responses.append(None)
+                continue
+            responses.append({
+                'code': status,
+                'headers': [{'name': name, 'value': value} for name, value in headers.items()],
+                'body': json.dumps(result),
+            })
+        return responses
+
+
+class FakeGraphHandler(BaseHTTPRequestHandler):
+
+    protocol_version = 'HTTP/1.1'
+    # Sin Nagle: cabeceras y cuerpo van en escrituras separadas y el ACK retardado añadiría ~40ms por llamada
+    disable_nagle_algorithm = True
+    server_graph = None
+
+
+    def log_message(self, format, *args):
+        pass
+
+
+    def do_GET(self):
+        self._handle('GET')
+
+
+    def do_POST(self):
+        self._handle('POST')
+
+
+    def do_DELETE(self):
+        self._handle('DELETE')
+
+
+    def _handle(self, method):
+        graph = self.server_graph
+        graph._count('round_trips')
+        if graph.latency:
+            time.sleep(graph.latency)
+
+        split = urlsplit(self.path)
+        params = dict(parse_qsl(split.query))
+        body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        files = {}
+        contentType = self.headers.get('Content-Type', '')
+        if contentType.startswith('multipart/'):
+            # Solo interesan los nombres de los ficheros y los campos simples
+            for name, filename, value in re.findall(rb'name="([^"]+)"(?:; filename="([^"]+)")?\r\n(?:[^\r\n]+\r\n)*\r\n(.*?)\r\n--', body, re.S):
+                if filename:
+                    files[name.decode()] = filename.decode()
+                else:
+                    params[name.decode()] = value.decode('utf-8', 'replace')
+        elif body:
+            params.update(parse_qsl(body.decode('utf-8')))
+
+        if method == 'POST' and 'batch' in params:
+            status, result, headers = 200, graph.batch(json.loads(params['batch']), files), {}
+        else:
+            status, result, headers = graph.handle(method, split.path, params, list(files.values()))
+
+        payload = json.dumps(result).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(payload)
+
+
+def _error(message, code, subcode=None, transient=False):
+    error = {'message': message, 'type': 'OAuthException', 'code': code, 'is_transient': transient, 'fbtrace_id': 'fake'}
+    if subcode:
+        error['error_subcode'] = subcode
+    return {'error': error}
+
+
+def _pattern(part):
+    # Agrupa las estadísticas por forma de la ruta, no por id
+    if part.startswith('act_'):
+        return 'act_{id}'
+    return '{id}' if part.isdigit() else part
+
+
+def _loads(value):
+    if not value or not isinstance(value, str):
+        return value
+    try:
+        return json.loads(value)
+    except ValueError:
+        return value
+
+
+def _decode(params):
+    # Los parámetros con objetos o listas llegan codificados en JSON
+    params = dict((key, _loads(value) if isinstance(value, str) and value[:1] in '{[' else value) for key, value in params.items())
+    # La API devuelve la creatividad de un anuncio como {'id': ...}
+    if isinstance(params.get('creative'), dict) and 'creative_id' in params['creative']:
+        params['creative'] = {'id': params['creative']['creative_id']}
+    return params
+
+
+def _select(obj, fields):
+    if not fields:
+        return dict(obj)
+    selected = dict((field, obj[field]) for field in fields.split(',') if field in obj)
+    if 'id' in obj:
+        selected['id'] = obj['id']
+    return selected
+
+
+def _matches(obj, condition):
+    # 'adset.id' se guarda como adset_id
+    value = obj.get(condition['field'], obj.get(condition['field'].replace('.', '_')))
+    operator = condition['operator']
+    if operator == 'EQUAL':
+        return value == condition['value']
+    if operator == 'CONTAIN':
+        return condition['value'].lower() in (value or '').lower()
+    if operator == 'IN':
+        return value in condition['value']
+    return True
+
+
+def _interest(name):
+    return {'id': str(6000000000000 + zlib.crc32(name.encode())), 'name': name, 'audience_size': 100000 + zlib.crc32(name.encode()) % 1000000}
+
+
+def _resolve(results, name, path):
+    value = results.get(name, (None, {}))[1]
+    for key in path.split('.'):
+        value = value[int(key)] if isinstance(value, list) else value.get(key, '')
+    return str(value)
@@ -0,0 +1,89 @@
+from datetime import datetime
+import calendar
+
+
+def toTimestamp(value):
+    # Acepta timestamps unix, datetimes o fechas ISO de la Graph API ('2017-05-10T12:00:00+0200')
+    if value is None or isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        value = datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    if value.tzinfo is None:
+        return calendar.timegm(value.timetuple())
+    return int(value.timestamp())
+
+
+class ObjectFilter(object):
+
+    def __init__(
+        self,
+        name=None,
+        name_contains=None,
+        effective_status=None,
+        updated_since=None,
+        updated_until=None,
+        campaign_ids=None,
+        adset_ids=None
+    ):
+        self.name = name
+        self.nameContains = name_contains
+        self.effectiveStatus = list(effective_status) if effective_status else None
+        self.updatedSince = toTimestamp(updated_since)
+        self.updatedUntil = toTimestamp(updated_until)
+        self.campaignIds = [str(fbid) for fbid in campaign_ids] if campaign_ids is not None else None
+        self.adsetIds = [str(fbid) for fbid in adset_ids] if adset_ids is not None else None
+
+
+    def filtering(self):
+        filtering = []
+        if self.name is not None:
+            filtering.append({'field': 'name', 'operator': 'EQUAL', 'value': self.name})
+        if self.nameContains is not None:
+            filtering.append({'field': 'name', 'operator': 'CONTAIN', 'value': self.nameContains})
+        if self.effectiveStatus:
+            filtering.append({'field': 'effective_status', 'operator': 'IN', 'value': self.effectiveStatus})
+        if self.updatedSince is not None:
+            filtering.append({'field': 'updated_time', 'operator': 'GREATER_THAN', 'value': self.updatedSince})
+        if self.updatedUntil is not None:
+            filtering.append({'field': 'updated_time', 'operator': 'LESS_THAN', 'value': self.updatedUntil})
+        if self.campaignIds is not None:
+            filtering.append({'field': 'campaign.id', 'operator': 'IN', 'value': self.campaignIds})
+        if self.adsetIds is not None:
+            filtering.append({'field': 'adset.id', 'operator': 'IN', 'value': self.adsetIds})
+        return filtering
+
+
+    def fields(self):
+        fields = ['name']
+        if self.effectiveStatus:
+            fields.append('effective_status')
+        if self.updatedSince is not None or self.updatedUntil is not None:
+            fields.append('updated_time')
+        if self.campaignIds is not None:
+            fields.append('campaign_id')
+        if self.adsetIds is not None:
+            fields.append('adset_id')
+        return fields
+
+
+    def matches(self, obj):
+        # Comprobación en local: respaldo cuando la API no acepta el filtro y verificación de lo que devuelve
+        if self.name is not None and obj.get('name') != self.name:
+            return False
+        if self.nameContains is not None and self.nameContains.lower() not in (obj.get('name') or '').lower():
+            return False
+        if self.effectiveStatus and obj.get('effective_status') not in self.effectiveStatus:
+            return False
+        if self.updatedSince is not None or self.updatedUntil is not None:
+            updated = toTimestamp(obj.get('updated_time'))
+            if updated is None:
+                return False
+            if self.updatedSince is not None and updated <= self.updatedSince:
+                return False
+            if self.updatedUntil is not None and updated >= self.updatedUntil:
+                return False
+        if self.campaignIds is not None and obj.get('campaign_id') not in self.campaignIds:
+            return False
+        if self.adsetIds is not None and obj.get('adset_id') not in self.adsetIds:
+            return False
+        return True
@@ -0,0 +1,61 @@
+from facebookads.api import FacebookAdsApi
+from facebookads.objects import AdUser
+import threading
+
+
+class Identity(object):
+
+    def __init__(self, api):
+        self._api = api
+        self._lock = threading.Lock()
+        self._userId = None
+        self._scopes = None
+
+
+    def userId(self):
+        with self._lock:
+            if self._userId is None:
+                self._userId = AdUser(fbid='me', api=self._api).remote_read()['id']
+            return self._userId
+
+
+    def cachedUserId(self):
+        return self._userId
+
+
+    def setUserId(self, user_id):
+        with self._lock:
+            self._userId = user_id
+
+
+    def scopes(self):
+        with self._lock:
+            if self._scopes is None:
+                permissions = self._api.call('GET', ('me', 'permissions')).json()['data']
+                self._scopes = set(p['permission'] for p in permissions if p['status'] == 'granted')
+            return self._scopes
+
+
+    def invalidate(self):
+        with self._lock:
+            self._userId = None
+            self._scopes = None
+
+
+# Una identidad por access token: si FacebookAdsApi se reinicia con otro token se vuelve a consultar
+_identities = {}
+_identitiesLock = threading.Lock()
+
+
+def getIdentity(api=None):
+    api = api or FacebookAdsApi.get_default_api()
+    token = api._session.access_token
+    with _identitiesLock:
+        if token not in _identities:
+            _identities[token] = Identity(api)
+        return _identities[token]
+
+
+def clearIdentities():
+    with _identitiesLock:
+        _identities.clear()
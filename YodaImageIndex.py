@@ -0,0 +1,65 @@
+from . import utils
+import os
+import sqlite3
+import threading
+
+
+class ImageIndex(object):
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.yoda_images.sqlite')
+
+    def __init__(self, path=DEFAULT_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS files ('
+                'path TEXT PRIMARY KEY, size INTEGER, mtime INTEGER, digest TEXT)'
+            )
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS images ('
+                'account_id TEXT, digest TEXT, image_hash TEXT, '
+                'PRIMARY KEY (account_id, digest))'
+            )
+
+
+    def close(self):
+        self._conn.close()
+
+
+    def digest(self, filepath):
+        # Solo se vuelve a leer el fichero si ha cambiado su tamaño o fecha de modificación
+        path = os.path.abspath(filepath)
+        stat = os.stat(path)
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT digest FROM files WHERE path = ? AND size = ? AND mtime = ?',
+                (path, stat.st_size, stat.st_mtime_ns)
+            ).fetchone()
+        if row:
+            return row[0]
+
+        digest = utils.fileDigest(path)
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO files (path, size, mtime, digest) VALUES (?, ?, ?, ?)',
+                (path, stat.st_size, stat.st_mtime_ns, digest)
+            )
+        return digest
+
+
+    def getHash(self, account_id, digest):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT image_hash FROM images WHERE account_id = ? AND digest = ?',
+                (account_id, digest)
+            ).fetchone()
+        return row[0] if row else None
+
+
+    def setHash(self, account_id, digest, image_hash):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO images (account_id, digest, image_hash) VALUES (?, ?, ?)',
+                (account_id, digest, image_hash)
+            )
@@ -0,0 +1,90 @@
+from collections import OrderedDict
+import hashlib
+import sqlite3
+import threading
+import json
+import time
+import os
+
+
+class ProvisioningJournal(object):
+
+    # Objetos creados por cada ejecución de createAccountStructure, para poder reanudarla si falla
+    DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.yoda_journal.sqlite')
+
+    def __init__(self, path=DEFAULT_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute(
+                'CREATE TABLE IF NOT EXISTS steps ('
+                'spec_key TEXT, step TEXT, value TEXT, created REAL, '
+                'PRIMARY KEY (spec_key, step))'
+            )
+
+
+    def close(self):
+        self._conn.close()
+
+
+    @staticmethod
+    def specKey(business_id, acc):
+        # La misma especificación en el mismo business es la misma ejecución
+        spec = json.dumps(acc, sort_keys=True, default=str)
+        return hashlib.sha256(('%s:%s' % (business_id, spec)).encode('utf-8')).hexdigest()
+
+
+    def open(self, business_id, acc):
+        return Checkpoints(self, self.specKey(business_id, acc))
+
+
+    def steps(self, spec_key):
+        with self._lock:
+            rows = self._conn.execute(
+                'SELECT step, value FROM steps WHERE spec_key = ? ORDER BY created',
+                (spec_key,)
+            ).fetchall()
+        return OrderedDict((step, json.loads(value)) for step, value in rows)
+
+
+    def record(self, spec_key, step, value):
+        with self._lock, self._conn:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO steps (spec_key, step, value, created) VALUES (?, ?, ?, ?)',
+                (spec_key, step, json.dumps(value), time.time())
+            )
+
+
+    def forget(self, spec_key):
+        with self._lock, self._conn:
+            self._conn.execute('DELETE FROM steps WHERE spec_key = ?', (spec_key,))
+
+
+class Checkpoints(object):
+
+    # Pasos completados de una ejecución; sin journal solo se guardan en memoria
+    def __init__(self, journal=None, spec_key=None):
+        self.journal = journal
+        self.specKey = spec_key
+        self._steps = journal.steps(spec_key) if journal is not None else OrderedDict()
+
+
+    def __contains__(self, step):
+        return step in self._steps
+
+
+    def get(self, step, default=None):
+        return self._steps.get(step, default)
+
+
+    def record(self, step, value):
+        self._steps[step] = value
+        if self.journal is not None:
+            self.journal.record(self.specKey, step, value)
+        return value
+
+
+    def forget(self):
+        self._steps.clear()
+        if self.journal is not None:
+            self.journal.forget(self.specKey)
@@ -0,0 +1,96 @@
+import threading
+import time
+
+
+class NameIndex(object):
+
+    def __init__(self, loader, duplicate_message, max_age=600):
+        # loader devuelve un iterable de objetos con 'id' y 'name'
+        self._loader = loader
+        self._duplicateMessage = duplicate_message
+        self._maxAge = max_age
+        self._lock = threading.Lock()
+        self._ids = None
+        self._loadedAt = None
+
+
+    def get(self, name, reload=True):
+        # reload=False no carga el índice: lo ha cargado quien llama con fill (p.ej. el cliente async)
+        with self._lock:
+            if reload and self._expired():
+                self._load()
+            ids = (self._ids or {}).get(name, [])
+        if len(ids) > 1:
+            raise LookupError(self._duplicateMessage)
+        return ids[0] if ids else None
+
+
+    def add(self, name, fbid):
+        # Si el índice aún no se ha construido, el objeto aparecerá al cargarlo
+        with self._lock:
+            if self._ids is not None and fbid not in self._ids.get(name, []):
+                self._ids.setdefault(name, []).append(fbid)
+
+
+    def configure(self, loader, max_age):
+        # Cada llamada trae su loader (tamaño de página, api) y su max_age; se usan en la próxima carga
+        with self._lock:
+            self._loader = loader
+            self._maxAge = max_age
+
+
+    def invalidate(self):
+        with self._lock:
+            self._ids = None
+
+
+    def expired(self):
+        with self._lock:
+            return self._expired()
+
+
+    def fill(self, objs):
+        # Carga con objetos obtenidos fuera del loader
+        ids = self._group(objs)
+        with self._lock:
+            self._ids = ids
+            self._loadedAt = time.time()
+
+
+    def _expired(self):
+        return self._ids is None or (self._maxAge is not None and time.time() - self._loadedAt > self._maxAge)
+
+
+    def _load(self):
+        self._ids = self._group(self._loader())
+        self._loadedAt = time.time()
+
+
+    @staticmethod
+    def _group(objs):
+        ids = {}
+        for obj in objs:
+            ids.setdefault(obj['name'], []).append(obj['id'])
+        return ids
+
+
+# Índices compartidos por todas las instancias que apuntan al mismo nodo
+_indexes = {}
+_indexesLock = threading.Lock()
+
+
+def getNameIndex(node_id, edge, loader, duplicate_message, max_age=600):
+    # Un único índice por nodo y edge, para que las altas lo actualicen; la configuración es la de la última llamada
+    with _indexesLock:
+        key = (node_id, edge)
+        if key not in _indexes:
+            _indexes[key] = NameIndex(loader, duplicate_message, max_age)
+            return _indexes[key]
+        index = _indexes[key]
+    index.configure(loader, max_age)
+    return index
+
+
+def clearNameIndexes():
+    with _indexesLock:
+        _indexes.clear()
@@ -1,10 +1,8 @@
-from facebookads.api import FacebookAdsApi, FacebookRequest
+from facebookads.api import FacebookAdsApi
 from facebookads import objects
 from facebookads.adobjects.abstractcrudobject import AbstractCrudObject
-from facebookads.api import FacebookRequest
-from facebookads.typechecker import TypeChecker
-from facebookads.adobjects.objectparser import ObjectParser
 from .YodaAccount import YodaAccount
+from .YodaEdges import Edge
 from . import utils
 from facebookads.objects import (
     Business,
@@ -26,299 +24,102 @@ class Project(AbstractCrudObject):
         super(Project, self).__init__(fbid, parent_id, api)
 
 
-    def api_get(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='GET',
-            endpoint='/',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AdAccount,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
+    api_get = Edge(
+        method='GET',
+        endpoint='/',
+        target_class=AdAccount,
+        api_type='NODE',
+        parser_class=None,
+    )
 
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
 
-
-    def api_update(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    api_update = Edge(
+        method='POST',
+        endpoint='/',
+        param_types={
             'name': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='POST',
-            endpoint='/',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=Project,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
-
-
-    def api_delete(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='DELETE',
-            endpoint='/',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
+        },
+        target_class=None,
+        api_type='NODE',
+        parser_class=None,
+    )
 
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
-
-
-    def api_update(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
-            'name': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='POST',
-            endpoint='/',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=Project,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
 
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+    api_delete = Edge(
+        method='DELETE',
+        endpoint='/',
+        api_type='NODE',
+        parser_class=None,
+    )
 
 
-    def add_page(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    add_page = Edge(
+        method='POST',
+        endpoint='/pages',
+        param_types={
             'page_id': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='POST',
-            endpoint='/pages',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
+        },
+        api_type='NODE',
+        parser_class=None,
+    )
 
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
 
+    def addPage(self, page_id, pending=False):
+        return self.add_page(params={'page_id': page_id}, pending=pending)
 
-    def addPage(self, page_id):
-        return self.add_page(params={'page_id': page_id})
 
+    get_pages = Edge(
+        method='GET',
+        endpoint='/pages',
+        api_type='NODE',
+        parser_class=None,
+    )
 
-    def get_pages(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='GET',
-            endpoint='/pages',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
 
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
-
-
-    def remove_page(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    remove_page = Edge(
+        method='DELETE',
+        endpoint='/pages',
+        param_types={
             'page_id': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='DELETE',
-            endpoint='/pages',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
+        },
+        api_type='NODE',
+        parser_class=None,
+    )
 
 
-    def removePage(self, page_id):
-        return self.remove_page(params={'page_id': page_id})
+    def removePage(self, page_id, pending=False):
+        return self.remove_page(params={'page_id': page_id}, pending=pending)
 
 
-    def add_ad_account(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    add_ad_account = Edge(
+        method='POST',
+        endpoint='/adaccounts',
+        param_types={
             'adaccount_id': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='POST',
-            endpoint='/adaccounts',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
+        },
+        api_type='NODE',
+        parser_class=None,
+    )
 
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
 
+    def addAdAccount(self, act_id, pending=False):
+        return self.add_ad_account(params={'adaccount_id': act_id}, pending=pending) #en formato "act_<ad_account_id>"
 
-    def addAdAccount(self, act_id):
-        return self.add_ad_account(params={'adaccount_id': act_id}) #en formato "act_<ad_account_id>"
 
+    get_ad_accounts = Edge(
+        method='GET',
+        endpoint='/adaccounts',
+        target_class=AdAccount,
+        parser_class=None,
+    )
 
-    def get_ad_accounts(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='GET',
-            endpoint='/adaccounts',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AdAccount,
-            api_type='EDGE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
 
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
-
-
-    def remove_ad_account(self, fields=None, params=None, batch=None, pending=False):
-        param_types = {
+    remove_ad_account = Edge(
+        method='DELETE',
+        endpoint='/adaccounts',
+        param_types={
             'adaccount_id': 'string'
-        }
-        enums = {
-        }
-        request = FacebookRequest(
-            node_id=self['id'],
-            method='DELETE',
-            endpoint='/adaccounts',
-            api=self._api,
-            param_checker=TypeChecker(param_types, enums),
-            target_class=AbstractCrudObject,
-            api_type='NODE',
-            response_parser=ObjectParser(reuse_object=self),
-        )
-        request.add_params(params)
-        request.add_fields(fields)
-
-        if batch is not None:
-            request.add_to_batch(batch)
-            return request
-        elif pending:
-            return request
-        else:
-            self.assure_call()
-            return request.execute()
\ No newline at end of file
+        },
+        api_type='NODE',
+        parser_class=None,
+    )
@@ -0,0 +1,288 @@
+from facebookads.api import FacebookAdsApi
+from facebookads.exceptions import FacebookRequestError
+from requests.exceptions import ConnectTimeout, ConnectionError as RequestsConnectionError, Timeout
+from urllib3.exceptions import NewConnectionError
+from .YodaApiHooks import ApiCallHook
+from .YodaThrottle import THROTTLE_CODES, isBatch
+from . import YodaTracing
+from collections import deque
+import threading
+import asyncio
+import random
+import json
+import time
+import re
+
+
+# Reintentos con espera exponencial y jitter. Desactivado (policy = None) no hace nada
+
+policy = None
+
+# Errores de la API que merece la pena repetir: desconocido, servicio no disponible, timeouts internos
+TRANSIENT_CODES = {1, 2}
+
+# Edges en los que un POST asigna o vincula (repetirlo no crea nada nuevo)
+IDEMPOTENT_EDGES = {'userpermissions', 'assigned_users', 'pages', 'adaccounts', 'agencies'}
+
+
+class RetryPolicy(object):
+
+    def __init__(
+        self,
+        max_attempts=5,
+        base_delay=0.5,
+        max_delay=30,
+        throttle_delay=60, # espera mínima tras un error de límite sin estimación de la API
+        max_wait=600, # si la API pide esperar más, se da por perdido
+        budget_ratio=0.2, # reintentos permitidos por llamada de la misma operación...
+        budget_min=10, # ...más este mínimo, en cada ventana
+        budget_window=60,
+        seed=None
+    ):
+        self.maxAttempts = max_attempts
+        self.baseDelay = base_delay
+        self.maxDelay = max_delay
+        self.throttleDelay = throttle_delay
+        self.maxWait = max_wait
+        self.budgetRatio = budget_ratio
+        self.budgetMin = budget_min
+        self.budgetWindow = budget_window
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._retries = {}
+        self._stats = {}
+
+
+    def delay(self, error, attempt, method, path, params):
+        # Segundos a esperar antes del intento attempt + 1, o None si no se debe reintentar
+        if attempt >= self.maxAttempts or not self.retryable(error, method, path, params):
+            return None
+        backoff = self._random.uniform(0, min(self.maxDelay, self.baseDelay * 2 ** (attempt - 1)))
+        hint = retryAfter(error)
+        if hint is None and isThrottle(error):
+            hint = self.throttleDelay
+        wait = max(backoff, hint or 0)
+        return wait if wait <= self.maxWait else None
+
+
+    def retryable(self, error, method, path, params):
+        if isThrottle(error) or notSent(error):
+            # La API la rechazó (o no llegó a enviarse): se puede repetir aunque sea una creación
+            return True
+        if not isTransient(error):
+            return False
+        return isIdempotent(method, path, params)
+
+
+    def allow(self, key):
+        # Presupuesto por operación: una caída de la API no multiplica las llamadas indefinidamente
+        with self._lock:
+            now = time.monotonic()
+            calls = self._window(self._calls, key, now)
+            retries = self._window(self._retries, key, now)
+            if len(retries) >= self.budgetMin + self.budgetRatio * len(calls):
+                self._count(key, 'budget_exhausted')
+                return False
+            retries.append(now)
+            return True
+
+
+    def _window(self, table, key, now):
+        entries = table.setdefault(key, deque())
+        while entries and entries[0] <= now - self.budgetWindow:
+            entries.popleft()
+        return entries
+
+
+    def called(self, key):
+        with self._lock:
+            now = time.monotonic()
+            self._window(self._calls, key, now).append(now)
+            self._count(key, 'calls')
+
+
+    def _count(self, key, counter, value=1):
+        stats = self._stats.setdefault(key, {'calls': 0, 'retries': 0, 'recovered': 0, 'gave_up': 0, 'budget_exhausted': 0})
+        stats[counter] += value
+
+
+    def record(self, key, counter, error=None, attempt=None, wait=None):
+        with self._lock:
+            self._count(key, counter)
+        tracer = YodaTracing.tracer
+        if tracer is not None and counter == 'retries':
+            tracer.emit({'type': 'retry', 'operation': key, 'attempt': attempt, 'wait': wait, 'error': error})
+
+
+    def stats(self):
+        with self._lock:
+            return dict((key, dict(stats)) for key, stats in self._stats.items())
+
+
+    def reset(self):
+        with self._lock:
+            self._calls.clear()
+            self._retries.clear()
+            self._stats.clear()
+
+
+    def operationKey(self, method, path):
+        span = YodaTracing.currentOperation()
+        return span or '%s /%s' % (method, YodaTracing.endpointPattern(path))
+
+
+    def run(self, method, path, params, send):
+        # send() hace un intento; se repite mientras el error sea recuperable y quede presupuesto
+        key = self.operationKey(method, path)
+        self.called(key)
+        attempt = 1
+        while True:
+            try:
+                response = send()
+            except Exception as e:
+                wait = self.delay(e, attempt, method, path, params)
+                if wait is None or not self.allow(key):
+                    if attempt > 1 or wait is not None:
+                        self.record(key, 'gave_up')
+                    raise
+                self.record(key, 'retries', e, attempt, wait)
+                time.sleep(wait)
+                attempt += 1
+                continue
+            if attempt > 1:
+                self.record(key, 'recovered')
+            return response
+
+
+    async def runAsync(self, method, path, params, send, transport_errors=()):
+        key = self.operationKey(method, path)
+        self.called(key)
+        attempt = 1
+        while True:
+            try:
+                response = await send()
+            except Exception as e:
+                error = TransportError(e) if isinstance(e, transport_errors) else e
+                wait = self.delay(error, attempt, method, path, params)
+                if wait is None or not self.allow(key):
+                    if attempt > 1 or wait is not None:
+                        self.record(key, 'gave_up')
+                    raise
+                self.record(key, 'retries', e, attempt, wait)
+                await asyncio.sleep(wait)
+                attempt += 1
+                continue
+            if attempt > 1:
+                self.record(key, 'recovered')
+            return response
+
+
+class TransportError(Exception):
+
+    # Errores de red de otros clientes (aiohttp) para clasificarlos igual que los de requests
+    def __init__(self, error):
+        super(TransportError, self).__init__(str(error))
+        self.error = error
+
+
+class RetryCall(ApiCallHook):
+
+    # El más externo: cada reintento vuelve a pasar por el reparto de llamadas y las trazas
+    order = 30
+
+    def __call__(self, method, path, params=None, headers=None, files=None, url_override=None, api_version=None):
+        current = policy
+        if current is None:
+            return self.call(method, path, params, headers, files, url_override, api_version)
+
+        def send():
+            # Los ficheros abiertos se rebobinan para que cada intento los envíe completos
+            for f in (files or {}).values():
+                if hasattr(f, 'seek'):
+                    f.seek(0)
+            return self.call(method, path, params, headers, files, url_override, api_version)
+        return current.run(method, path, params, send)
+
+
+def isThrottle(error):
+    return isinstance(error, FacebookRequestError) and error.api_error_code() in THROTTLE_CODES
+
+
+def isTransient(error):
+    if isinstance(error, FacebookRequestError):
+        return (
+            error.api_transient_error() or
+            error.api_error_code() in TRANSIENT_CODES or
+            (error.http_status() or 0) >= 500
+        )
+    return isinstance(error, (Timeout, RequestsConnectionError, TransportError))
+
+
+def notSent(error):
+    # Fallos al conectar: la petición no llegó al servidor
+    if isinstance(error, ConnectTimeout):
+        return True
+    if isinstance(error, RequestsConnectionError) and error.args:
+        reason = getattr(error.args[0], 'reason', error.args[0])
+        return isinstance(reason, NewConnectionError)
+    if isinstance(error, TransportError):
+        return isinstance(error.error, ConnectionRefusedError) or type(error.error).__name__ == 'ClientConnectorError'
+    return False
+
+
+def isIdempotent(method, path, params=None):
+    if method in ('GET', 'DELETE'):
+        return True
+    if isBatch(method, path, params):
+        batch = params['batch']
+        if isinstance(batch, str):
+            batch = json.loads(batch)
+        return all(isIdempotent(call.get('method', 'GET'), call.get('relative_url', '')) for call in batch)
+    parts = _parts(path)
+    # POST a un nodo (actualización) o a un edge de asignación
+    return len(parts) == 1 or (len(parts) == 2 and parts[1] in IDEMPOTENT_EDGES)
+
+
+def _parts(path):
+    if isinstance(path, str):
+        path = re.sub(r'^https?://[^/]+', '', path.split('?')[0]).split('/')
+        path = [part for part in path if part]
+        if path and re.match(r'^v\d+\.\d+$', path[0]):
+            path = path[1:]
+    return [str(part).strip('/') for part in path if str(part).strip('/')]
+
+
+def retryAfter(error):
+    # Indicaciones de la API: cabecera Retry-After o estimated_time_to_regain_access (minutos)
+    if not isinstance(error, FacebookRequestError):
+        return None
+    headers = error.http_headers() or {}
+    if isinstance(headers, list):
+        headers = dict((h['name'], h['value']) for h in headers)
+    headers = dict((str(name).lower(), value) for name, value in headers.items())
+    if headers.get('retry-after'):
+        try:
+            return float(headers['retry-after'])
+        except ValueError:
+            pass
+    try:
+        usage = json.loads(headers.get('x-business-use-case-usage') or '{}')
+    except ValueError:
+        return None
+    minutes = [entry.get('estimated_time_to_regain_access') or 0 for entries in usage.values() for entry in entries]
+    return max(minutes) * 60 if minutes and max(minutes) else None
+
+
+def enableRetries(api=None, instance=None):
+    global policy
+    RetryCall.install(api or FacebookAdsApi.get_default_api())
+    if instance is not None or policy is None:
+        policy = instance or RetryPolicy()
+    return policy
+
+
+def disableRetries(api=None):
+    global policy
+    RetryCall.uninstall(api or FacebookAdsApi.get_default_api())
+    policy = None
@@ -0,0 +1,109 @@
+from collections import OrderedDict
+import json
+import os
+import sqlite3
+import threading
+import time
+
+
+class SearchCache(object):
+
+    DEFAULT_PATH = os.path.join(os.path.expanduser('~'), '.yoda_search.sqlite')
+
+    def __init__(self, path=DEFAULT_PATH, ttl=24 * 3600, max_entries=4096):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._maxEntries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        # Con path=None la caché vive solo en memoria
+        self._path = path
+        self._conn = None
+
+
+    @staticmethod
+    def key(params):
+        # Normaliza la consulta para que variantes equivalentes compartan entrada
+        normalized = {}
+        for name, value in params.items():
+            if name == 'q':
+                value = value.strip().lower()
+            elif isinstance(value, (list, tuple, set)):
+                value = sorted(set(v.strip() if isinstance(v, str) else v for v in value))
+            normalized[name] = value
+        return json.dumps(normalized, sort_keys=True)
+
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            conn = self._db()
+            if entry is None and conn is not None:
+                row = conn.execute(
+                    'SELECT value, expires FROM searches WHERE key = ?', (key,)
+                ).fetchone()
+                if row:
+                    entry = (json.loads(row[0]), row[1])
+                    self._store(key, entry)
+            if entry is None or entry[1] < now:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+
+    def set(self, key, value):
+        entry = (value, time.time() + self.ttl)
+        with self._lock:
+            self._store(key, entry)
+            conn = self._db()
+            if conn is not None:
+                with conn:
+                    conn.execute(
+                        'INSERT OR REPLACE INTO searches (key, value, expires) VALUES (?, ?, ?)',
+                        (key, json.dumps(value), entry[1])
+                    )
+
+
+    def getOrFetch(self, params, fetch):
+        key = self.key(params)
+        value = self.get(key)
+        if value is None:
+            value = fetch()
+            self.set(key, value)
+        return value
+
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            conn = self._db()
+            if conn is not None:
+                with conn:
+                    conn.execute('DELETE FROM searches')
+
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self._entries)}
+
+
+    def _db(self):
+        # El fichero se abre con el primer uso, no al importar utils
+        if self._conn is None and self._path:
+            self._conn = sqlite3.connect(self._path, check_same_thread=False)
+            with self._conn:
+                self._conn.execute(
+                    'CREATE TABLE IF NOT EXISTS searches ('
+                    'key TEXT PRIMARY KEY, value TEXT, expires REAL)'
+                )
+        return self._conn
+
+
+    def _store(self, key, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self._maxEntries:
+            self._entries.popitem(last=False)
@@ -0,0 +1,334 @@
+from facebookads.objects import Campaign, AdSet, Ad, AdCreative, TargetingSpecsField
+from facebookads.adobjects.adcreativelinkdata import AdCreativeLinkData
+from facebookads.adobjects.adcreativeobjectstoryspec import AdCreativeObjectStorySpec
+from facebookads.adobjects.targetinggeolocation import TargetingGeoLocation
+from .YodaBatch import YodaBatch
+from .YodaFilter import toTimestamp
+from .YodaTracing import traced
+from . import utils
+
+
+# Sincronización de una cuenta con su especificación (el formato acc de createAccountStructure):
+# se compara con lo que hay en la API y solo se crea, actualiza o borra lo que ha cambiado
+
+ADSET_FIELDS = [
+    AdSet.Field.name,
+    AdSet.Field.campaign_id,
+    AdSet.Field.bid_amount,
+    AdSet.Field.daily_budget,
+    AdSet.Field.start_time,
+    AdSet.Field.end_time,
+    AdSet.Field.targeting,
+]
+
+AD_FIELDS = [Ad.Field.name, Ad.Field.adset_id, Ad.Field.creative]
+
+CREATIVE_FIELDS = [AdCreative.Field.object_story_spec]
+
+# Máximo de ids por petición ?ids=
+IDS_PER_REQUEST = 50
+
+
+class Change(object):
+
+    SYMBOLS = {'create': '+', 'update': '~', 'delete': '-'}
+
+    def __init__(self, action, kind, fbid=None, params=None, index=None):
+        self.action = action # 'create', 'update' o 'delete'
+        self.kind = kind # 'campaign', 'adset' o 'ad'
+        self.fbid = fbid
+        self.params = params or {}
+        self.index = index # posición del anuncio en acc['ads']
+
+
+    def format(self):
+        target = self.fbid or ''
+        if self.index is not None:
+            target = ('%s #%d' % (target, self.index)).strip()
+        fields = ', '.join(sorted(self.params)) if self.action == 'update' else ''
+        return ('%s %s %s %s' % (self.SYMBOLS[self.action], self.kind, target, fields)).rstrip()
+
+
+class AccountPlan(object):
+
+    # Campos de la especificación que no se pueden comparar sin resolver algo más
+    UNCHECKED_HINTS = {
+        'keywords': 'refresh_interests=True',
+        'image_filename': 'image_index',
+    }
+
+    def __init__(self, account, acc, campaign_id, adset_id, image_hashes, interests, changes, image_index=None, unchecked=None):
+        self.account = account
+        self.acc = acc
+        self.campaignId = campaign_id
+        self.adsetId = adset_id
+        self.imageHashes = image_hashes # None si la imagen aún no se conoce en esta cuenta
+        self.interests = interests # None si no se han resuelto al planificar
+        self.changes = changes
+        self.imageIndex = image_index
+        self.unchecked = unchecked or [] # campos que no se han comparado: sus cambios no aparecen en el plan
+
+
+    def __len__(self):
+        return len(self.changes)
+
+
+    def __iter__(self):
+        return iter(self.changes)
+
+
+    def counts(self):
+        counts = {'create': 0, 'update': 0, 'delete': 0}
+        for change in self.changes:
+            counts[change.action] += 1
+        return counts
+
+
+    def format(self):
+        counts = self.counts()
+        lines = ['%s: %d creaciones, %d actualizaciones, %d borrados' % (
+            self.acc['name'], counts['create'], counts['update'], counts['delete']
+        )]
+        lines.extend('  ' + change.format() for change in self.changes)
+        if self.unchecked:
+            lines.append('  sin comparar: %s' % ', '.join(
+                '%s (usa %s)' % (field, self.UNCHECKED_HINTS[field]) for field in self.unchecked
+            ))
+        return '\n'.join(lines)
+
+
+    @traced()
+    def apply(self, max_workers=4):
+        # Todos los cambios en un YodaBatch: lo que depende de un objeto nuevo referencia su resultado
+        if not self.changes:
+            return {}
+        acc = self.acc
+        account = self.account
+        name = acc['name']
+        # Planificar no escribe nada: las imágenes y los intereses que faltan se resuelven aquí
+        newAds = [acc['ads'][change.index] for change in self.changes if change.kind == 'ad' and change.action != 'delete']
+        missing = [ad['image_filename'] for ad in newAds if self.imageHashes.get(ad['image_filename']) is None]
+        if missing:
+            self.imageHashes.update(account.createAdImages(missing, index=self.imageIndex))
+        if self.interests is None and any(change.kind == 'adset' and change.action == 'create' for change in self.changes):
+            self.interests = utils.getInterests(acc['keywords'])
+
+        batch = YodaBatch(api=account.get_api_assured(), max_workers=max_workers)
+        campaign = Campaign(fbid=self.campaignId)
+        adset = AdSet(fbid=self.adsetId)
+
+        calls = []
+        for change in self.changes:
+            if change.action == 'delete':
+                obj = AdSet(fbid=change.fbid) if change.kind == 'adset' else Ad(fbid=change.fbid)
+                calls.append(batch.add(obj.api_delete(pending=True), name='delete%s' % change.fbid))
+            elif change.kind == 'campaign':
+                calls.append(batch.add(account.createCampaign(name, pending=True), name='campaign'))
+                campaign = Campaign(fbid=YodaBatch.resultRef('campaign'))
+            elif change.kind == 'adset' and change.action == 'create':
+                calls.append(batch.add(account.createAdSet(
+                    campaign,
+                    name,
+                    acc['bid_amount'],
+                    acc['start_date'],
+                    acc['end_date'],
+                    acc['country_code'],
+                    daily_budget=acc['spend_cap']*100,
+                    interests=self.interests,
+                    pending=True
+                ), name='adset'))
+                adset = AdSet(fbid=YodaBatch.resultRef('adset'))
+            elif change.kind == 'adset':
+                calls.append(batch.add(AdSet(fbid=change.fbid).api_update(params=change.params, pending=True), name='adset'))
+            else:
+                # Las creatividades no se pueden modificar: un anuncio cambiado lleva una creatividad nueva
+                ad = acc['ads'][change.index]
+                creaName = batch.add(account.createAdCreative(name,
+                    self.imageHashes[ad['image_filename']],
+                    ad['message'],
+                    ad['headline'],
+                    ad['description'],
+                    ad['caption'],
+                    ad['url'],
+                    acc['page_id'],
+                    pending=True), name='creative%d' % change.index)
+                crea = {'creative_id': YodaBatch.resultRef(creaName)}
+                if change.action == 'create':
+                    request = account.createAd(name, adset, crea, Ad.Status.paused, pending=True)
+                else:
+                    request = Ad(fbid=change.fbid).api_update(params={Ad.Field.creative: crea}, pending=True)
+                calls.extend([creaName, batch.add(request, name='ad%d' % change.index)])
+
+        batch.execute()
+        if batch.hasResult('campaign'):
+            account.campaignNameIndex().add(name, batch.getResult('campaign').get_id_assured())
+        return dict((call, batch.getResult(call)) for call in calls)
+
+
+@traced()
+def fetchStructure(account, name, page_size=100):
+    # Campaña con ese nombre, sus conjuntos, sus anuncios y las creatividades de estos, con los campos mínimos
+    campaigns = list(account.findCampaigns(page_size=page_size, name=name))
+    if len(campaigns) > 1:
+        raise LookupError("Hay más de una campaña con el mismo nombre")
+    campaign = campaigns[0] if campaigns else None
+    adsets = []
+    if campaign is not None:
+        adsets = list(account.findAdSets(ADSET_FIELDS, page_size, campaign_ids=[campaign.get_id_assured()]))
+    ads = []
+    if adsets:
+        ads = list(account.findAds(AD_FIELDS, page_size, adset_ids=[adset.get_id_assured() for adset in adsets]))
+    creativeIds = sorted(set(_creativeId(ad) for ad in ads if _creativeId(ad)))
+    creatives = fetchObjects(account.get_api_assured(), creativeIds, CREATIVE_FIELDS)
+    return campaign, adsets, ads, creatives
+
+
+def fetchObjects(api, ids, fields):
+    # Varios objetos por petición con ?ids=
+    objs = {}
+    for i in range(0, len(ids), IDS_PER_REQUEST):
+        params = {'ids': ','.join(ids[i:i + IDS_PER_REQUEST]), 'fields': ','.join(fields)}
+        objs.update(api.call('GET', (), params=params).json())
+    return objs
+
+
+@traced()
+def planStructure(account, acc, image_index=None, page_size=100, refresh_interests=False):
+    # Solo lee: no sube imágenes ni crea nada, y el mismo estado da siempre el mismo plan
+    name = acc['name']
+    campaign, adsets, ads, creatives = fetchStructure(account, name, page_size)
+    # Los intereses de un conjunto existente se conservan; con refresh_interests se vuelven a buscar
+    # a partir de las keywords (una sola vez: apply usa los mismos)
+    interests = utils.getInterests(acc['keywords']) if refresh_interests else None
+    # Hashes de las imágenes ya subidas a esta cuenta según el ImageIndex; sin índice no se conocen
+    # y la imagen no se compara (para detectar un cambio solo de imagen hace falta el índice)
+    imageHashes = {}
+    for ad in acc['ads']:
+        filepath = ad['image_filename']
+        if filepath not in imageHashes:
+            imageHashes[filepath] = image_index.getHash(account.get_id_assured(), image_index.digest(filepath)) if image_index is not None else None
+
+    changes = []
+    if campaign is None:
+        changes.append(Change('create', 'campaign'))
+
+    # Un conjunto por campaña, con el nombre de la cuenta; sobra cualquier otro
+    adset = next((adset for adset in adsets if adset.get(AdSet.Field.name) == name), None)
+    for other in adsets:
+        if other is not adset:
+            changes.append(Change('delete', 'adset', other.get_id_assured()))
+    if adset is None:
+        changes.append(Change('create', 'adset'))
+    else:
+        params = _adsetChanges(adset, acc, interests)
+        if params:
+            changes.append(Change('update', 'adset', adset.get_id_assured(), params))
+
+    # Anuncios: se conservan los que ya tienen el mismo contenido, se reaprovechan los demás
+    # cambiándoles la creatividad, y solo se crean o borran los que faltan o sobran
+    remaining = [ad for ad in ads if adset is not None and ad.get(Ad.Field.adset_id) == adset.get_id_assured()]
+    remoteSignatures = dict((ad.get_id_assured(), _remoteSignature(creatives.get(_creativeId(ad)))) for ad in remaining)
+    unmatched = []
+    for i, ad in enumerate(acc['ads']):
+        imageHash = imageHashes[ad['image_filename']]
+        if imageHash is None and image_index is not None:
+            # Con índice, una imagen sin hash no se ha subido nunca a esta cuenta: no coincide con ninguna
+            imageHash = ''
+        signature = _signature(ad, imageHash, acc['page_id'])
+        match = next((remote for remote in remaining if _sameContent(signature, remoteSignatures[remote.get_id_assured()])), None)
+        if match is None:
+            unmatched.append(i)
+        else:
+            remaining.remove(match)
+    for i in unmatched:
+        if remaining:
+            # Solo cambia la creatividad (la nueva se crea al aplicar el plan)
+            changes.append(Change('update', 'ad', remaining.pop(0).get_id_assured(), {Ad.Field.creative: None}, index=i))
+        else:
+            changes.append(Change('create', 'ad', index=i))
+    for remote in remaining:
+        changes.append(Change('delete', 'ad', remote.get_id_assured()))
+
+    unchecked = []
+    if adset is not None and interests is None:
+        unchecked.append('keywords')
+    if ads and image_index is None:
+        unchecked.append('image_filename')
+
+    return AccountPlan(
+        account,
+        acc,
+        campaign.get_id_assured() if campaign is not None else None,
+        adset.get_id_assured() if adset is not None else None,
+        imageHashes,
+        interests,
+        changes,
+        image_index,
+        unchecked
+    )
+
+
+def _adsetChanges(adset, acc, interests):
+    params = {}
+    for field, value in ((AdSet.Field.bid_amount, acc['bid_amount']), (AdSet.Field.daily_budget, acc['spend_cap']*100)):
+        if str(adset.get(field)) != str(value):
+            params[field] = value
+    for field, value in ((AdSet.Field.start_time, acc['start_date']), (AdSet.Field.end_time, acc['end_date'])):
+        if toTimestamp(adset.get(field)) != toTimestamp(value):
+            params[field] = value
+
+    targeting = adset.get(AdSet.Field.targeting) or {}
+    countries = (targeting.get(TargetingSpecsField.geo_locations) or {}).get(TargetingGeoLocation.Field.countries) or []
+    remoteInterests = [{'id': intr['id'], 'name': intr.get('name')} for intr in targeting.get(TargetingSpecsField.interests) or []]
+    if interests is None:
+        interests = remoteInterests
+    if list(countries) != [acc['country_code']] or set(str(intr['id']) for intr in remoteInterests) != set(str(intr['id']) for intr in interests):
+        # El targeting se sustituye entero, igual que se crea en createAdSet
+        params[AdSet.Field.targeting] = {
+            TargetingSpecsField.geo_locations: {TargetingGeoLocation.Field.countries: [acc['country_code']]},
+            TargetingSpecsField.interests: interests,
+        }
+    return params
+
+
+def _creativeId(ad):
+    creative = ad.get(Ad.Field.creative) or {}
+    return creative.get('id')
+
+
+def _signature(ad, imageHash, pageId):
+    signature = [str(value) for value in (
+        pageId,
+        imageHash,
+        ad['message'],
+        ad['headline'],
+        ad['description'],
+        ad['caption'],
+        ad['url'],
+    )]
+    if imageHash is None:
+        # Imagen sin hash conocido en esta cuenta (o sin ImageIndex): no se compara
+        signature[1] = None
+    return tuple(signature)
+
+
+def _sameContent(signature, remote):
+    if remote is None:
+        return False
+    return all(value is None or value == remoteValue for value, remoteValue in zip(signature, remote))
+
+
+def _remoteSignature(creative):
+    if not creative:
+        return None
+    spec = creative.get(AdCreative.Field.object_story_spec) or {}
+    linkData = spec.get(AdCreativeObjectStorySpec.Field.link_data) or {}
+    return tuple(str(value) for value in (
+        spec.get(AdCreativeObjectStorySpec.Field.page_id),
+        linkData.get(AdCreativeLinkData.Field.image_hash),
+        linkData.get(AdCreativeLinkData.Field.message),
+        linkData.get(AdCreativeLinkData.Field.name),
+        linkData.get(AdCreativeLinkData.Field.description),
+        linkData.get(AdCreativeLinkData.Field.caption),
+        linkData.get(AdCreativeLinkData.Field.link),
+    ))
@@ -0,0 +1,57 @@
+import json
+
+
+class InterestTaxonomy(object):
+
+    def __init__(self, entries):
+        self._entries = [dict(entry) for entry in entries]
+        self._byId = {}
+        self._byLevel = {}
+        # Trie sobre 'path': cada nodo se indexa además por su prefijo para acceder en O(1)
+        self._root = {'children': {}, 'entries': []}
+        self._nodes = {(): self._root}
+        for entry in self._entries:
+            path = tuple(entry.get('path') or ())
+            self._byId[str(entry['id'])] = entry
+            self._byLevel.setdefault(len(path), []).append(entry)
+            node = self._root
+            node['entries'].append(entry)
+            for depth, name in enumerate(path):
+                if name not in node['children']:
+                    node['children'][name] = {'children': {}, 'entries': []}
+                    self._nodes[path[:depth + 1]] = node['children'][name]
+                node = node['children'][name]
+                node['entries'].append(entry)
+
+
+    def __len__(self):
+        return len(self._entries)
+
+
+    def byId(self, interest_id):
+        return self._byId.get(str(interest_id))
+
+
+    def byLevel(self, level):
+        return list(self._byLevel.get(level, []))
+
+
+    def byPrefix(self, path):
+        node = self._nodes.get(tuple(path))
+        return list(node['entries']) if node else []
+
+
+    def children(self, path=()):
+        node = self._nodes.get(tuple(path))
+        return list(node['children'].keys()) if node else []
+
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump(self._entries, f)
+
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f))
@@ -0,0 +1,245 @@
+from facebookads.api import FacebookAdsApi
+from facebookads.exceptions import FacebookRequestError
+from .YodaApiHooks import ApiCallHook
+from urllib.parse import urlsplit
+import threading
+import json
+import time
+import re
+
+
+# Reparto de llamadas según las cabeceras de uso de la Graph API. Desactivado (scheduler = None) no hace nada
+
+scheduler = None
+
+# Códigos de error de límite de llamadas (app, usuario, página, cuenta y business use case)
+THROTTLE_CODES = {4, 17, 32, 613} | set(range(80000, 80015))
+
+
+class TokenBucket(object):
+
+    def __init__(self, rate, capacity):
+        self._lock = threading.Lock()
+        self.rate = float(rate)
+        self.capacity = float(capacity)
+        self.tokens = float(capacity)
+        self.updated = time.monotonic() # puede quedar en el futuro mientras el bucket está en pausa
+
+
+    def _refill(self, now):
+        if now > self.updated:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+
+
+    def reserve(self, tokens=1):
+        # Reserva sin bloquear: devuelve los segundos que hay que esperar antes de hacer la llamada
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens -= tokens
+            return max(0.0, self.updated - now) + max(0.0, -self.tokens) / self.rate
+
+
+    def setRate(self, rate, capacity=None):
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+            if capacity is not None:
+                self.capacity = float(capacity)
+                self.tokens = min(self.tokens, self.capacity)
+
+
+    def pause(self, seconds):
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.tokens = min(self.tokens, 0.0)
+            self.updated = max(self.updated, now + seconds)
+
+
+class Scheduler(object):
+
+    def __init__(
+        self,
+        app_rate=50, # llamadas por segundo como máximo, con uso bajo
+        account_rate=10,
+        business_rate=10,
+        burst=10,
+        target_usage=75, # % de uso a partir del cual se reduce el ritmo
+        min_factor=0.02,
+        default_pause=60 # segundos de pausa si se llega al 100% sin estimación de la API
+    ):
+        self.rates = {'app': app_rate, 'act': account_rate, 'buc': business_rate}
+        self.burst = burst
+        self.targetUsage = target_usage
+        self.minFactor = min_factor
+        self.defaultPause = default_pause
+        self._lock = threading.Lock()
+        self._buckets = {}
+        self._usage = {}
+        self._businessOf = {} # nodo -> claves de business use case que le afectan
+
+
+    def bucket(self, key):
+        with self._lock:
+            if key not in self._buckets:
+                self._buckets[key] = TokenBucket(self.rates[key.split(':')[0]], self.burst)
+            return self._buckets[key]
+
+
+    def keysFor(self, node):
+        keys = ['app']
+        if node and node.startswith('act_'):
+            keys.append('act:' + node)
+        with self._lock:
+            keys.extend(self._businessOf.get(node, ()))
+        return keys
+
+
+    def reserve(self, method, path, params=None):
+        # Un token por llamada; en un batch, uno por cada llamada incluida en su cuenta
+        counts = {}
+        for node in requestNodes(method, path, params):
+            for key in self.keysFor(node):
+                counts[key] = counts.get(key, 0) + 1
+        return max([self.bucket(key).reserve(count) for key, count in counts.items()] or [0.0])
+
+
+    def update(self, method, path, params, headers, body=None):
+        nodes = requestNodes(method, path, params)
+        if isBatch(method, path, params):
+            # Cada respuesta del batch trae sus propias cabeceras
+            for node, item in zip(nodes, body or []):
+                if item:
+                    self._updateNode(node, dict((h['name'], h['value']) for h in item.get('headers') or []))
+            nodes = [None]
+        self._updateNode(nodes[0], headers)
+
+
+    def throttled(self, method, path, params, error):
+        # Si aun así llega un error de límite, se para el bucket hasta que la API lo permita
+        self.update(method, path, params, error.http_headers() or {})
+        if error.api_error_code() in THROTTLE_CODES:
+            for node in requestNodes(method, path, params):
+                for key in self.keysFor(node):
+                    if key != 'app' or error.api_error_code() in (4, 17):
+                        self.bucket(key).pause(self.defaultPause)
+
+
+    def _updateNode(self, node, headers):
+        if not headers:
+            return
+        appUsage = _header(headers, 'X-App-Usage')
+        if appUsage:
+            self._setUsage('app', _usagePct(appUsage), 0)
+        accountUsage = _header(headers, 'X-Ad-Account-Usage')
+        if accountUsage and node and node.startswith('act_'):
+            self._setUsage('act:' + node, accountUsage.get('acc_id_util_pct', 0), 0)
+        businessUsage = _header(headers, 'X-Business-Use-Case-Usage')
+        for businessId, entries in (businessUsage or {}).items():
+            key = 'buc:' + businessId
+            if node:
+                with self._lock:
+                    keys = self._businessOf.setdefault(node, [])
+                    if key not in keys:
+                        keys.append(key)
+            self._setUsage(
+                key,
+                max(_usagePct(entry) for entry in entries),
+                max(entry.get('estimated_time_to_regain_access') or 0 for entry in entries) * 60
+            )
+
+
+    def _setUsage(self, key, usage, regain):
+        bucket = self.bucket(key)
+        with self._lock:
+            self._usage[key] = usage
+        # Ritmo completo hasta target_usage; a partir de ahí decrece hasta min_factor al 100%
+        if usage <= self.targetUsage:
+            factor = 1.0
+        else:
+            factor = max(self.minFactor, ((100.0 - usage) / (100.0 - self.targetUsage)) ** 2)
+        # La ráfaga también se reduce: con uso alto no se deben acumular tokens
+        bucket.setRate(self.rates[key.split(':')[0]] * factor, max(1.0, self.burst * factor))
+        if regain or usage >= 100:
+            bucket.pause(regain or self.defaultPause)
+
+
+    def usage(self):
+        with self._lock:
+            return dict(
+                (key, {'usage': self._usage.get(key), 'rate': bucket.rate, 'tokens': bucket.tokens})
+                for key, bucket in self._buckets.items()
+            )
+
+
+class ThrottledCall(ApiCallHook):
+
+    order = 20
+
+    def __call__(self, method, path, params=None, headers=None, files=None, url_override=None, api_version=None):
+        current = scheduler
+        if current is None:
+            return self.call(method, path, params, headers, files, url_override, api_version)
+        wait = current.reserve(method, path, params)
+        if wait:
+            time.sleep(wait)
+        try:
+            response = self.call(method, path, params, headers, files, url_override, api_version)
+        except FacebookRequestError as e:
+            current.throttled(method, path, params, e)
+            raise
+        current.update(method, path, params, response.headers(), response.json() if isBatch(method, path, params) else None)
+        return response
+
+
+def isBatch(method, path, params):
+    return method == 'POST' and not path and bool(params) and 'batch' in params
+
+
+def requestNodes(method, path, params=None):
+    # Nodo al que va cada llamada (uno por llamada incluida si es un batch)
+    if isBatch(method, path, params):
+        batch = params['batch']
+        if isinstance(batch, str):
+            batch = json.loads(batch)
+        return [_node(call.get('relative_url', '')) for call in batch]
+    return [_node(path)]
+
+
+def _node(path):
+    if isinstance(path, str):
+        path = urlsplit(path).path if '://' in path else path.split('?')[0]
+        path = [part for part in path.split('/') if part]
+        if path and re.match(r'^v\d+\.\d+$', path[0]):
+            path = path[1:]
+    return str(path[0]).strip('/') if path else None
+
+
+def _header(headers, name):
+    value = headers.get(name) or headers.get(name.lower())
+    if not value:
+        return None
+    try:
+        return json.loads(value) if isinstance(value, str) else value
+    except ValueError:
+        return None
+
+
+def _usagePct(usage):
+    return max(usage.get('call_count') or 0, usage.get('total_cputime') or 0, usage.get('total_time') or 0)
+
+
+def enableThrottling(api=None, instance=None):
+    global scheduler
+    ThrottledCall.install(api or FacebookAdsApi.get_default_api())
+    if instance is not None or scheduler is None:
+        scheduler = instance or Scheduler()
+    return scheduler
+
+
+def disableThrottling(api=None):
+    global scheduler
+    ThrottledCall.uninstall(api or FacebookAdsApi.get_default_api())
+    scheduler = None
@@ -0,0 +1,423 @@
+from facebookads.api import FacebookAdsApi, _top_level_param_json_encode
+from facebookads.exceptions import FacebookRequestError
+from .YodaApiHooks import ApiCallHook
+from urllib.parse import urlencode
+from collections import OrderedDict, deque
+import contextvars
+import contextlib
+import functools
+import threading
+import json
+import time
+import os
+import re
+
+
+# Trazas de las llamadas a la Graph API. Desactivado (tracer = None) solo cuesta una comprobación por llamada
+
+tracer = None
+
+# Operación del wrapper en curso; los hilos del wrapper la heredan con bindContext
+_currentSpan = contextvars.ContextVar('yodaSpan', default=None)
+
+# Límites superiores (ms) de los buckets del histograma de latencia
+LATENCY_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, float('inf'))
+
+BATCH_BUCKETS = (1, 2, 5, 10, 20, 50, float('inf'))
+
+
+class Histogram(object):
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * len(bounds)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+
+    def add(self, value):
+        for i, bound in enumerate(self.bounds):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+
+    def percentile(self, p):
+        # Aproximado: límite superior del bucket (acotado por el máximo observado)
+        if not self.count:
+            return None
+        target = p / 100.0 * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return min(bound, self.max)
+        return self.max
+
+
+    def export(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'buckets': dict((str(bound), count) for bound, count in zip(self.bounds, self.counts) if count),
+        }
+
+
+class OperationStats(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.batchSizes = Histogram(BATCH_BUCKETS)
+
+
+    def add(self, event):
+        self.calls += 1
+        if event['error']:
+            self.errors += 1
+        self.bytesSent += event['bytes_sent']
+        self.bytesReceived += event['bytes_received']
+        self.latency.add(event['elapsed'] * 1000)
+        if event['batch_size']:
+            self.batchSizes.add(event['batch_size'])
+
+
+    def export(self):
+        return {
+            'calls': self.calls,
+            'errors': self.errors,
+            'bytes_sent': self.bytesSent,
+            'bytes_received': self.bytesReceived,
+            'latency_ms': self.latency.export(),
+            'batch_sizes': self.batchSizes.export(),
+        }
+
+
+class Span(object):
+
+    def __init__(self, name, parent=None, run=None):
+        self.name = name
+        self.parent = parent
+        self.run = run
+        # Paso del run al que se atribuye: el ancestro inmediatamente por debajo de la raíz
+        if run is None or parent is None:
+            self.step = None
+        elif parent is run.root:
+            self.step = name
+        else:
+            self.step = parent.step
+
+
+class RunSummary(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.root = None
+        self.start = time.perf_counter()
+        self.elapsed = None
+        self.steps = OrderedDict()
+        self.calls = 0
+        self.errors = 0
+        self.bytesSent = 0
+        self.bytesReceived = 0
+        self._lock = threading.Lock()
+
+
+    def _step(self, name):
+        if name not in self.steps:
+            self.steps[name] = {'elapsed': 0.0, 'calls': 0, 'call_time': 0.0}
+        return self.steps[name]
+
+
+    def addSpan(self, span, elapsed):
+        with self._lock:
+            self._step(span.name)['elapsed'] += elapsed
+
+
+    def addEvent(self, step, event):
+        with self._lock:
+            self.calls += 1
+            self.errors += 1 if event['error'] else 0
+            self.bytesSent += event['bytes_sent']
+            self.bytesReceived += event['bytes_received']
+            stats = self._step(step or self.name)
+            stats['calls'] += 1
+            stats['call_time'] += event['elapsed']
+
+
+    def export(self):
+        return {
+            'name': self.name,
+            'elapsed': self.elapsed,
+            'calls': self.calls,
+            'errors': self.errors,
+            'bytes_sent': self.bytesSent,
+            'bytes_received': self.bytesReceived,
+            'steps': dict(self.steps),
+        }
+
+
+    def format(self):
+        lines = ['%s: %.3fs, %d llamadas (%d errores), %.1f KB enviados, %.1f KB recibidos' % (
+            self.name, self.elapsed or 0, self.calls, self.errors, self.bytesSent / 1024.0, self.bytesReceived / 1024.0
+        )]
+        for name, step in self.steps.items():
+            share = 100 * step['elapsed'] / self.elapsed if self.elapsed else 0
+            lines.append('  %-40s %8.3fs %5.1f%% %5d llamadas' % (name, step['elapsed'], share, step['calls']))
+        return '\n'.join(lines)
+
+
+class Tracer(object):
+
+    def __init__(self, max_runs=20):
+        self._lock = threading.Lock()
+        self._hooks = []
+        self._operations = {}
+        self._endpoints = {}
+        self._runs = deque(maxlen=max_runs)
+
+
+    def addHook(self, hook):
+        # hook(event): event['type'] es 'call' (una petición HTTP) o 'run' (fin de una operación con resumen)
+        self._hooks.append(hook)
+        return hook
+
+
+    def removeHook(self, hook):
+        self._hooks.remove(hook)
+
+
+    def record(self, event):
+        span = _currentSpan.get()
+        event['operation'] = span.name if span else None
+        with self._lock:
+            for key, table in ((event['operation'] or event['endpoint'], self._operations), (event['endpoint'], self._endpoints)):
+                if key not in table:
+                    table[key] = OperationStats()
+                table[key].add(event)
+        if span is not None and span.run is not None:
+            span.run.addEvent(span.step, event)
+        self.emit(event)
+
+
+    def finishRun(self, run):
+        with self._lock:
+            self._runs.append(run)
+        self.emit({'type': 'run', 'operation': run.name, 'run': run})
+
+
+    def emit(self, event):
+        for hook in list(self._hooks):
+            hook(event)
+
+
+    def operations(self):
+        with self._lock:
+            return dict((name, stats.export()) for name, stats in self._operations.items())
+
+
+    def endpoints(self):
+        with self._lock:
+            return dict((name, stats.export()) for name, stats in self._endpoints.items())
+
+
+    def runs(self, name=None):
+        with self._lock:
+            return [run for run in self._runs if name is None or run.name == name]
+
+
+    def lastRun(self, name=None):
+        runs = self.runs(name)
+        return runs[-1] if runs else None
+
+
+    def reset(self):
+        with self._lock:
+            self._operations.clear()
+            self._endpoints.clear()
+            self._runs.clear()
+
+
+    def format(self):
+        lines = ['%-44s %7s %6s %9s %9s %9s %10s %10s' % ('operation', 'calls', 'errors', 'p50_ms', 'p95_ms', 'max_ms', 'sent_kb', 'recv_kb')]
+        with self._lock:
+            for name, stats in sorted(self._operations.items(), key=lambda item: -item[1].latency.total):
+                lines.append('%-44s %7d %6d %9.1f %9.1f %9.1f %10.1f %10.1f' % (
+                    name,
+                    stats.calls,
+                    stats.errors,
+                    stats.latency.percentile(50),
+                    stats.latency.percentile(95),
+                    stats.latency.max,
+                    stats.bytesSent / 1024.0,
+                    stats.bytesReceived / 1024.0,
+                ))
+        return '\n'.join(lines)
+
+
+class TracedCall(ApiCallHook):
+
+    # El más interno: cada intento se registra por separado
+    order = 10
+
+    def __call__(self, method, path, params=None, headers=None, files=None, url_override=None, api_version=None):
+        current = tracer
+        if current is None:
+            return self.call(method, path, params, headers, files, url_override, api_version)
+        start = time.perf_counter()
+        response = error = None
+        try:
+            response = self.call(method, path, params, headers, files, url_override, api_version)
+            return response
+        except FacebookRequestError as e:
+            error = e
+            raise
+        finally:
+            if error is not None:
+                status, body = error.http_status(), error.body()
+            elif response is not None:
+                status, body = response.status(), response.body()
+            else:
+                status, body = None, None
+            current.record(callEvent(method, path, params, files, status, body, time.perf_counter() - start, error))
+
+
+def callEvent(method, path, params, files, status, body, elapsed, error=None):
+    params = params or {}
+    batch = params.get('batch') if method == 'POST' and not path else None
+    return {
+        'type': 'call',
+        'method': method,
+        'endpoint': '%s /%s' % (method, endpointPattern(path)),
+        'status': status,
+        'elapsed': elapsed,
+        'bytes_sent': requestSize(path, params, files),
+        'bytes_received': responseSize(body),
+        'batch_size': len(batch) if isinstance(batch, (list, tuple)) else 0,
+        'error': error,
+    }
+
+
+def endpointPattern(path):
+    # Agrupa por forma de la ruta: act_123/campaigns -> act_{id}/campaigns
+    if isinstance(path, str):
+        path = re.sub(r'^https?://[^/]+/(v\d+\.\d+/)?', '', path.split('?')[0]).split('/')
+    parts = []
+    for part in path:
+        part = str(part).strip('/')
+        if part.startswith('act_'):
+            part = 'act_{id}'
+        elif part.isdigit():
+            part = '{id}'
+        if part:
+            parts.append(part)
+    return '/'.join(parts)
+
+
+def responseSize(body):
+    # Los errores traen el cuerpo ya decodificado; el tamaño es el del JSON sin comprimir
+    if body is None:
+        return 0
+    if not isinstance(body, (str, bytes)):
+        body = json.dumps(body)
+    return len(body.encode('utf-8')) if isinstance(body, str) else len(body)
+
+
+def requestSize(path, params, files=None):
+    # Aproximado: ruta, parámetros codificados y tamaño de los ficheros adjuntos
+    size = len(path) if isinstance(path, str) else sum(len(str(part)) + 1 for part in path)
+    if params:
+        size += len(urlencode(_top_level_param_json_encode(params)))
+    for value in (files or {}).values():
+        try:
+            if isinstance(value, tuple):
+                value = value[-1]
+            size += len(value) if isinstance(value, (bytes, str)) else os.fstat(value.fileno()).st_size
+        except (AttributeError, OSError, TypeError):
+            pass
+    return size
+
+
+def enableTracing(api=None, instance=None):
+    global tracer
+    TracedCall.install(api or FacebookAdsApi.get_default_api())
+    if instance is not None or tracer is None:
+        tracer = instance or Tracer()
+    return tracer
+
+
+def disableTracing(api=None):
+    global tracer
+    TracedCall.uninstall(api or FacebookAdsApi.get_default_api())
+    tracer = None
+
+
+@contextlib.contextmanager
+def operation(name, run=False):
+    if tracer is None:
+        yield None
+        return
+    parent = _currentSpan.get()
+    summary = parent.run if parent else None
+    if summary is None and run:
+        summary = RunSummary(name)
+    span = Span(name, parent, summary)
+    if summary is not None and summary.root is None:
+        summary.root = span
+    token = _currentSpan.set(span)
+    start = time.perf_counter()
+    try:
+        yield span
+    finally:
+        _currentSpan.reset(token)
+        elapsed = time.perf_counter() - start
+        if summary is not None:
+            if summary.root is span:
+                summary.elapsed = elapsed
+                if tracer is not None:
+                    tracer.finishRun(summary)
+            elif parent is summary.root:
+                summary.addSpan(span, elapsed)
+
+
+def traced(name=None, run=False):
+    # Decorador para los métodos del wrapper; con run=True se genera un RunSummary por ejecución
+    def decorator(fn):
+        opName = name or fn.__qualname__
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if tracer is None:
+                return fn(*args, **kwargs)
+            with operation(opName, run):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def currentOperation():
+    span = _currentSpan.get()
+    return span.name if span else None
+
+
+def bindContext(fn):
+    # Para hilos: la función se ejecuta dentro de la operación desde la que se creó
+    if tracer is None:
+        return fn
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
@@ -0,0 +1,69 @@
+from facebookads.api import FacebookAdsApi
+from http.cookiejar import DefaultCookiePolicy
+from requests.adapters import HTTPAdapter
+import gzip
+
+
+class PooledAdapter(HTTPAdapter):
+
+    def __init__(self, pool_size=20, max_retries=0, compress_requests=False, compress_min_size=1024):
+        self.compressRequests = compress_requests
+        self.compressMinSize = compress_min_size
+        # pool_block: si todas las conexiones están ocupadas se espera en lugar de abrir una nueva que luego se descarta
+        super(PooledAdapter, self).__init__(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=max_retries,
+            pool_block=True,
+        )
+
+
+    def send(self, request, **kwargs):
+        if self.compressRequests:
+            self._compress(request)
+        return super(PooledAdapter, self).send(request, **kwargs)
+
+
+    def _compress(self, request):
+        # Solo cuerpos de formulario grandes: las subidas de imágenes ya van comprimidas
+        body = request.body
+        if not body or 'Content-Encoding' in request.headers:
+            return
+        if request.headers.get('Content-Type', '').startswith('multipart/'):
+            return
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if not isinstance(body, bytes) or len(body) < self.compressMinSize:
+            return
+        request.body = gzip.compress(body)
+        request.headers['Content-Encoding'] = 'gzip'
+        request.headers['Content-Length'] = str(len(request.body))
+
+
+def configureTransport(
+    api=None,
+    pool_size=20,
+    keep_alive=True,
+    gzip_responses=True,
+    compress_requests=False,
+    connect_timeout=5,
+    read_timeout=60,
+    max_retries=0
+):
+    api = api or FacebookAdsApi.get_default_api()
+    session = api._session
+    http = session.requests
+
+    adapter = PooledAdapter(pool_size, max_retries, compress_requests)
+    http.mount('https://', adapter)
+    http.mount('http://', adapter)
+
+    # La Graph API no usa cookies: sin cookie jar compartido la sesión se puede usar desde varios hilos
+    http.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+
+    http.headers['Connection'] = 'keep-alive' if keep_alive else 'close'
+    http.headers['Accept-Encoding'] = 'gzip, deflate' if gzip_responses else 'identity'
+
+    # requests acepta (conexión, lectura) como timeout
+    session.timeout = (connect_timeout, read_timeout)
+    return api
@@ -1,87 +1,201 @@
-from facebookads.objects import (AdUser, Campaign, AdSet)
+from facebookads.objects import (Campaign, AdSet)
 from facebookads.adobjects import adaccount
 from facebookads.adobjects.campaign import Campaign
 from facebookads.adobjects.targetingsearch import TargetingSearch
-from .Exceptions import InvalidObject
+from facebookads.api import FacebookRequest
+from facebookads.adobjects.abstractcrudobject import AbstractCrudObject
+from .Exceptions import InvalidObject, BatchError
+from .YodaBatch import YodaBatch
+from .YodaIdentity import getIdentity
+from .YodaSearchCache import SearchCache
+from .YodaTaxonomy import InterestTaxonomy
+from .YodaTracing import traced, bindContext
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
 import json
+import os
 
 
-def activateCampaign(campaign):
+@traced()
+def activateCampaign(campaign, pending=False):
     params = {
         Campaign.Field.status : Campaign.Status.active
     }
-    response = campaign.api_update(params=params)
+    response = campaign.api_update(params=params, pending=pending)
     return response
 
 
-def pauseCampaign(campaign):
+@traced()
+def pauseCampaign(campaign, pending=False):
     params = {
         Campaign.Field.status : Campaign.Status.paused
     }
-    response = campaign.api_update(params=params)
+    response = campaign.api_update(params=params, pending=pending)
     return response
 
 
+# Caché de TargetingSearch en disco (SearchCache.DEFAULT_PATH); se cambia con configureSearchCache
+searchCache = SearchCache()
+
+interestTaxonomy = None
+
+
+def configureSearchCache(path=SearchCache.DEFAULT_PATH, ttl=24 * 3600, enabled=True):
+    # path=None deja la caché solo en memoria y enabled=False la desactiva
+    global searchCache
+    searchCache = SearchCache(path, ttl) if enabled else None
+    return searchCache
+
+
+def cachedSearch(params):
+    if searchCache is None:
+        return TargetingSearch.search(params=params)
+    data = searchCache.getOrFetch(
+        params,
+        lambda: [item.export_all_data() for item in TargetingSearch.search(params=params)]
+    )
+    return searchObjects(data)
+
+
+def searchObjects(data):
+    results = []
+    for item in data:
+        searchObj = TargetingSearch()
+        searchObj.update(item)
+        results.append(searchObj)
+    return results
+
+
+@traced()
+def setObjectsStatus(objects, status, max_workers=4, api=None):
+    # Acepta campañas, adsets o anuncios (o sus ids); las actualizaciones van en batches concurrentes
+    batch = YodaBatch(api=api, max_workers=max_workers)
+    names = {}
+    for obj in objects:
+        # Los ids pueden venir como números; cada objeto se actualiza una sola vez aunque se repita
+        fbid = obj.get_id_assured() if isinstance(obj, AbstractCrudObject) else str(obj)
+        if fbid in names:
+            continue
+        request = FacebookRequest(node_id=fbid, method='POST', endpoint='/', api=api)
+        request.add_params({Campaign.Field.status: status})
+        names[fbid] = batch.add(request)
+
+    batchError = None
+    try:
+        batch.execute()
+    except BatchError as e:
+        batchError = e
+
+    succeeded = [fbid for fbid, name in names.items() if batch.hasResult(name)]
+    failed = dict(
+        (fbid, batch.getError(name) or batchError)
+        for fbid, name in names.items() if not batch.hasResult(name)
+    )
+    return succeeded, failed
+
+
+def activateObjects(objects, max_workers=4, api=None):
+    return setObjectsStatus(objects, Campaign.Status.active, max_workers, api)
+
+
+def pauseObjects(objects, max_workers=4, api=None):
+    return setObjectsStatus(objects, Campaign.Status.paused, max_workers, api)
+
+
+@traced()
 def getInterestsByKeyword(keyword):
     params ={
         'q': keyword,
         'type': 'adinterest'
     }
-    resp = TargetingSearch.search(params=params)
+    resp = cachedSearch(params)
     return resp
 
 
+@traced()
 def getInterestSuggestionByInterestList(keywords):
     params = {
     'type': 'adinterestsuggestion',
     'interest_list': keywords,
     }
-    resp = TargetingSearch.search(params=params)
+    resp = cachedSearch(params)
     return resp
 
 
+@traced()
 def getAllCategories():
     params = {
         'type': 'adTargetingCategory',
         'class': 'interests',
     }
-    resp = TargetingSearch.search(params=params)
+    resp = cachedSearch(params)
     return resp
 
 
+@traced()
+def getInterestTaxonomy(path=None, refresh=False):
+    # Se carga una sola vez; con path se guarda en disco y los arranques siguientes no llaman a la API
+    global interestTaxonomy
+    if interestTaxonomy is None or refresh:
+        if path and os.path.exists(path) and not refresh:
+            interestTaxonomy = InterestTaxonomy.load(path)
+        else:
+            interestTaxonomy = InterestTaxonomy(cat.export_all_data() for cat in getAllCategories())
+            if path:
+                interestTaxonomy.save(path)
+    return interestTaxonomy
+
+
 def getCategoriesByLevel(level):
-    interests = getAllInterests()
-    results = []
-    for inter in interests:
-        if len(inter['path']) == level:
-            results.append(inter)
-    return results
+    return getInterestTaxonomy().byLevel(level)
 
 
+@traced()
 def validateInterests(keywords):
     params = {
         'type': 'adinterestvalid',
         'interest_list': keywords
     }
 
-    resp = TargetingSearch.search(params=params)
+    resp = cachedSearch(params)
     return resp
 
 
-def getInterests(keywords):
-    interests = []
-    #comprobamos si alguna keyword es un interes en si misma
-    for respInterest in validateInterests(keywords):
-        if respInterest['valid'] == True:
-            interests.append({'id': respInterest['id'], 'name': respInterest['name']})
-    for kw in keywords:
-        for targeting in getInterestsByKeyword(kw):
-            interests.append({'id': targeting['id'], 'name': targeting['name']})
-    suggestedInterests = getInterestSuggestionByInterestList([intr['name'] for intr in interests])
+@traced()
+def getInterests(keywords, max_workers=8):
+    # Intereses indexados por id: sin duplicados y en orden de aparición
+    interests = {}
+
+    def addInterest(intr):
+        interests.setdefault(intr['id'], {'id': intr['id'], 'name': intr['name']})
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        validated = executor.submit(bindContext(lambda: list(validateInterests(keywords))))
+        byKeyword = [executor.submit(bindContext(lambda kw: list(getInterestsByKeyword(kw))), kw) for kw in keywords]
+
+        #comprobamos si alguna keyword es un interes en si misma
+        for respInterest in validated.result():
+            if respInterest['valid'] == True:
+                addInterest(respInterest)
+        for future in byKeyword:
+            for targeting in future.result():
+                addInterest(targeting)
+
+    suggestedInterests = getInterestSuggestionByInterestList([intr['name'] for intr in interests.values()])
     for intr in suggestedInterests:
-        interests.append({'id': intr['id'], 'name': intr['name']})
-    return interests
+        addInterest(intr)
+    return list(interests.values())
+
+
+@traced()
+def getCurrentAccountId(api=None):
+    # Se consulta una sola vez por access token
+    return getIdentity(api).userId()
 
 
-def getCurrentAccountId():
-    return AdUser(fbid='me').remote_read()['id']
\ No newline at end of file
+def fileDigest(filepath, chunk_size=1 << 20):
+    digest = hashlib.md5()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()